@@ -0,0 +1,32 @@
+"""
+Micro-benchmark: local chart ranking latency and suggestion prompt size with and without pre-ranking.
+
+    python benchmarks/bench_chart_ranker.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+import main  # noqa: E402
+
+PROMPTS = [
+    "Show revenue by region",
+    "Trend of monthly sales over time",
+    "Correlation between price and quantity",
+    "Distribution of customer ages",
+]
+
+
+if __name__ == "__main__":
+    # The service default (0) sends the whole catalog; measure a ranked subset
+    suggester = main.ChartSuggester(main.CATALOG, top_k=int(os.getenv("CHART_RANKER_TOP_K") or 8))
+    number = 2000
+    best = min(timeit.repeat(lambda: [suggester.candidate_config_json(p) for p in PROMPTS], number=number, repeat=5))
+    print(f"rank + subset   {best / number / len(PROMPTS) * 1e6:8.1f} us/prompt (top_k={suggester.top_k})")
+    full = len(suggester.charts_config_json)
+    for prompt in PROMPTS:
+        subset = len(suggester.candidate_config_json(prompt))
+        print(f"{prompt:40s} {subset:6d} / {full} chars ({subset / full:.0%})")
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark: FastAPI's default response path (response_model validation,
+jsonable_encoder, json.dumps) vs. the direct serializer used for chart responses.
+
+    python benchmarks/bench_json_serialization.py
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import main  # noqa: E402
+from response_encoding import orjson, serialize  # noqa: E402
+
+START = datetime(2024, 1, 1)
+
+
+def result(rows: int, charts: int = 4):
+    return {
+        "intent": "visualization",
+        "charts": [{
+            "chart_id": chart,
+            "chart_type": "line_chart",
+            "encoding": {"x": "day", "y": "revenue", "color": "region"},
+            "data": {
+                "status": "completed",
+                "rowCount": rows,
+                "resultData": [
+                    {"day": START + timedelta(hours=i), "region": f"region_{i % 7}", "revenue": i * 1.37, "units": i % 50}
+                    for i in range(rows)
+                ],
+            },
+            "error": None,
+        } for chart in range(charts)],
+        "timings": {"total": 1.0},
+    }
+
+
+def fastapi_default(payload):
+    validated = main.ExecutePromptResponse(**payload)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+if __name__ == "__main__":
+    print(f"direct serializer: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+    for rows in (1000, 10000, 50000):
+        payload = result(rows)
+        size = len(serialize(payload))
+        for name, fn in (("fastapi_default", fastapi_default), ("direct", serialize)):
+            best = min(timeit.repeat(lambda: fn(payload), number=3, repeat=3)) / 3
+            print(f"{rows:6d} rows x4 {size / 1024 / 1024:6.1f} MiB {name:16s} {best * 1e3:9.1f} ms")
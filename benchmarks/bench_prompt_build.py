@@ -0,0 +1,72 @@
+"""
+Micro-benchmark: the per-request prompt path (ranked suggestion prompt, rules,
+compacted query-builder prompt) on freshly built objects vs. the prebuilt
+shared instances.
+
+    python benchmarks/bench_prompt_build.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+import main  # noqa: E402
+from chart_catalog import ChartCatalog  # noqa: E402
+from charts_config import charts_config  # noqa: E402
+
+PROMPT = "Show revenue by region"
+DATASET_METADATA = {
+    "columns": [
+        {"name": "region", "data_type": "string"},
+        {"name": "order_date", "data_type": "date"},
+        {"name": "revenue", "data_type": "double"},
+    ]
+    + [{"name": f"col_{i}", "data_type": "string"} for i in range(40)]
+}
+# The first suggestion is built by the rules, the second (a filter) is left to the LLM
+SUGGESTIONS = [
+    {"user_prompt": PROMPT, "chosen_charts": [{"id": 1, "name": "bar_chart"}]},
+    {"user_prompt": "Revenue over order date since 2023", "chosen_charts": [{"id": 9, "name": "line_chart"}]},
+]
+# Ranked subset as bench_chart_ranker.py measures it; the service default (0) sends the whole catalog
+TOP_K = int(os.getenv("CHART_RANKER_TOP_K") or 8)
+
+
+def prompt_path(suggester, builder):
+    suggest_messages = [
+        suggester.system_message,
+        {"role": "user", "content": f"User request: {PROMPT}\nCharts config: {suggester.candidate_config_json(PROMPT)}"},
+    ]
+    built, remaining = builder.build_with_rules(DATASET_METADATA, SUGGESTIONS)
+    build_messages = builder.build_messages(DATASET_METADATA, remaining)[0] if remaining else None
+    return suggest_messages, built, build_messages
+
+
+def per_request():
+    # What each request used to do: compile the catalog and build the suggester
+    # (with its ranker) and the query builder (with its rules engine)
+    catalog = ChartCatalog(charts_config)
+    suggester = main.ChartSuggester(catalog, top_k=TOP_K)
+    builder = main.ChartValidatorAndQueryBuilder(catalog, main.MODEL)
+    return prompt_path(suggester, builder)
+
+
+PREBUILT_SUGGESTER = main.ChartSuggester(main.CATALOG, top_k=TOP_K)
+
+
+def prebuilt():
+    return prompt_path(PREBUILT_SUGGESTER, main.QUERY_BUILDER)
+
+
+if __name__ == "__main__":
+    assert per_request() == prebuilt(), "prebuilt prompts must match the per-request ones"
+    number = 500
+    for name, fn in (("per_request", per_request), ("prebuilt", prebuilt)):
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{name:12s} {best * 1e6:8.1f} us/request")
+    suggest_messages, built, build_messages = prebuilt()
+    print(f"suggest prompt {len(suggest_messages[1]['content'])} chars (top_k={TOP_K}), "
+          f"rules built {len(built)} chart(s), "
+          f"build prompt {len(build_messages[1]['content']) if build_messages else 0} chars")
@@ -0,0 +1,48 @@
+"""
+Micro-benchmark: chart response size and encoding time for row JSON vs. the opt-in formats.
+
+    python benchmarks/bench_response_encoding.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from response_encoding import arrow_available, compress, encode_chart_data, serialize, _brotli  # noqa: E402
+
+ROWS = 10000
+RESULT = {
+    "intent": "visualization",
+    "charts": [{
+        "chart_id": 5,
+        "chart_type": "scatter_plot",
+        "data": {
+            "status": "completed",
+            "rowCount": ROWS,
+            "resultData": [
+                {"order_date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "region": f"region_{i % 7}", "revenue": i * 1.37, "units": i % 50}
+                for i in range(ROWS)
+            ],
+        },
+    }],
+}
+
+
+def variants():
+    yield "rows", lambda: serialize(RESULT)
+    yield "columnar", lambda: serialize(encode_chart_data(RESULT, "columnar"))
+    if arrow_available():
+        yield "arrow (base64)", lambda: serialize(encode_chart_data(RESULT, "arrow"))
+    yield "rows + gzip", lambda: compress(serialize(RESULT), "gzip")
+    yield "columnar + gzip", lambda: compress(serialize(encode_chart_data(RESULT, "columnar")), "gzip")
+    if _brotli() is not None:
+        yield "columnar + br", lambda: compress(serialize(encode_chart_data(RESULT, "columnar")), "br")
+
+
+if __name__ == "__main__":
+    number = 10
+    for name, fn in variants():
+        size = len(fn())
+        best = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print(f"{name:18s} {size / 1024:9.1f} KiB {best * 1e3:8.2f} ms")
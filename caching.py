@@ -0,0 +1,227 @@
+# caching.py
+
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    In-process LRU cache with a per-entry time-to-live.
+    Tracks hits, misses and evictions for /metrics.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 300.0,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Optional byte budget: entries are weighed with `sizeof` and LRU-evicted past `max_bytes`
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, size, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Larger than the whole budget: not worth evicting everything else for
+            return
+        self._remove(key)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), size, value)
+        self.total_bytes += size
+        while len(self._data) > self.maxsize or (self.max_bytes is not None and self.total_bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self.total_bytes -= entry[1]
+        return True
+
+    def pop(self, key: Hashable) -> bool:
+        return self._remove(key)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every key matching `predicate`; returns how many were removed."""
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if self.max_bytes is not None:
+            stats["bytes"] = self.total_bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+class SQLiteCache:
+    """
+    On-disk key/value tier backed by SQLite, with TTL and a max entry count
+    (oldest entries are evicted first). Methods are blocking; call them from
+    a worker thread in async code.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400.0, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now + self.ttl),
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created_at LIMIT ?)", (overflow,)
+                )
+                self.evictions += overflow
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            "path": self.path,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work, later callers await the same task and get the same result or error.
+    The work is cancelled when every caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        # Callers still awaiting each task; a detached (forgotten) task keeps its count
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.started = 0
+        self.shared = 0
+        self.cancelled = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.started += 1
+
+            def done(finished: asyncio.Task) -> None:
+                if self._calls.get(key) is finished:
+                    del self._calls[key]
+
+            task.add_done_callback(done)
+        else:
+            self.shared += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # shield: one caller giving up must not cancel the work the others are waiting on
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters[task] - 1
+            if remaining:
+                self._waiters[task] = remaining
+            else:
+                del self._waiters[task]
+                if not task.done():
+                    # The last caller gave up: nobody is left to use the result
+                    task.cancel()
+                    self.cancelled += 1
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Task]:
+        return self._calls.get(key)
+
+    def forget(self, key: Hashable) -> None:
+        """Detach an in-flight call so the next caller starts fresh work."""
+        self._calls.pop(key, None)
+
+    def forget_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Detach every in-flight call whose key matches `predicate`; returns how many."""
+        keys = [key for key in self._calls if predicate(key)]
+        for key in keys:
+            del self._calls[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared, "cancelled": self.cancelled}
@@ -0,0 +1,135 @@
+# chart_catalog.py
+
+import importlib
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from chart_rules import derive_role_requirements
+
+
+class CatalogError(ValueError):
+    """Raised for a chart catalog that cannot be loaded or has malformed entries."""
+
+
+class ChartRecord:
+    """One compiled charts_config entry. `roles` maps requirement keys to typed roles."""
+
+    __slots__ = (
+        "chart_id", "name", "title", "max_rows", "why", "use_cases",
+        "data_requirements", "roles", "config",
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.chart_id: int = config["chart_id"]
+        self.name: str = config["name"]
+        self.title: str = config["title"]
+        self.max_rows: Optional[int] = config.get("max_rows")
+        self.why: List[str] = config.get("why") or []
+        self.use_cases: List[str] = config.get("use_cases") or []
+        self.data_requirements: Dict[str, Any] = config["data_requirements"]
+        self.roles: Dict[str, Optional[str]] = derive_role_requirements(config)
+
+    def __repr__(self) -> str:
+        return f"ChartRecord({self.chart_id}, {self.name!r})"
+
+
+def _check_entry(source: str, index: int, entry: Any) -> None:
+    def fail(message: str) -> None:
+        raise CatalogError(f"{source}[{index}]: {message}")
+
+    if not isinstance(entry, dict):
+        fail(f"expected an object, got {type(entry).__name__}")
+    if not isinstance(entry.get("chart_id"), int) or isinstance(entry.get("chart_id"), bool):
+        fail("'chart_id' must be an integer")
+    for key in ("name", "title"):
+        if not isinstance(entry.get(key), str) or not entry[key].strip():
+            fail(f"'{key}' must be a non-empty string")
+    if not isinstance(entry.get("data_requirements"), dict) or not entry["data_requirements"]:
+        fail("'data_requirements' must be a non-empty object")
+    for key in ("why", "use_cases"):
+        value = entry.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            fail(f"'{key}' must be a list of strings")
+    max_rows = entry.get("max_rows")
+    if max_rows is not None and (not isinstance(max_rows, int) or isinstance(max_rows, bool) or max_rows <= 0):
+        fail("'max_rows' must be a positive integer")
+
+
+class ChartCatalog:
+    """
+    Validated, indexed chart catalog. Lookups by chart id (int or string) or by
+    name are dictionary hits; `charts` keeps the original entries in order for
+    prompt building and the /charts-config endpoint.
+    """
+
+    def __init__(self, charts: List[Dict[str, Any]], source: str = "charts_config.py"):
+        if not isinstance(charts, list) or not charts:
+            raise CatalogError(f"{source}: expected a non-empty list of charts")
+        records = []
+        by_id: Dict[str, ChartRecord] = {}
+        by_name: Dict[str, ChartRecord] = {}
+        for index, entry in enumerate(charts):
+            _check_entry(source, index, entry)
+            record = ChartRecord(entry)
+            if str(record.chart_id) in by_id:
+                raise CatalogError(f"{source}[{index}]: duplicate chart_id {record.chart_id}")
+            if record.name in by_name:
+                raise CatalogError(f"{source}[{index}]: duplicate name {record.name!r}")
+            by_id[str(record.chart_id)] = record
+            by_name[record.name] = record
+            records.append(record)
+        self.source = source
+        self.records: Tuple[ChartRecord, ...] = tuple(records)
+        self.charts: List[Dict[str, Any]] = [record.config for record in records]
+        self._by_id = by_id
+        self._by_name = by_name
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[ChartRecord]:
+        return iter(self.records)
+
+    def by_id(self, chart_id: Any) -> Optional[ChartRecord]:
+        return self._by_id.get(str(chart_id))
+
+    def by_name(self, name: Any) -> Optional[ChartRecord]:
+        return self._by_name.get(str(name))
+
+
+def _read_file(path: str) -> Any:
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise CatalogError(f"{path}: YAML catalogs require 'pyyaml' (pip install pyyaml)")
+        parse, errors = yaml.safe_load, (yaml.YAMLError,)
+    else:
+        parse, errors = json.load, (ValueError,)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = parse(f)
+    except OSError as e:
+        raise CatalogError(f"{path}: {e}")
+    except errors as e:
+        raise CatalogError(f"{path}: cannot parse: {e}")
+    # Either a bare list of charts or {"charts": [...]}
+    return data.get("charts") if isinstance(data, dict) else data
+
+
+def load_catalog(path: str = "") -> ChartCatalog:
+    """
+    Load and validate the chart catalog from a JSON/YAML file, or from
+    charts_config.py (re-imported, so edits are picked up) when `path` is empty.
+    """
+    if path:
+        return ChartCatalog(_read_file(path), source=path)
+    try:
+        module = importlib.reload(importlib.import_module("charts_config"))
+        charts = module.charts_config
+    except Exception as e:
+        # A syntax or runtime error in the edited module is a malformed catalog too
+        raise CatalogError(f"charts_config.py: cannot load: {type(e).__name__}: {e}")
+    return ChartCatalog(charts, source=os.path.basename(module.__file__))
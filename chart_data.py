@@ -0,0 +1,245 @@
+# chart_data.py
+
+import math
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+# Row keys the data-lakehouse uses for result rows, in lookup order
+ROW_KEYS = ("resultData", "result_data", "data")
+
+LTTB_CHARTS = frozenset({
+    "line_chart", "area_chart", "stepped_line_chart", "smooth_line_chart",
+    "horizon_chart", "big_number_with_trendline",
+})
+BINNED_CHARTS = frozenset({"histogram"})
+TOP_N_CHARTS = frozenset({"bar_chart", "pie_chart"})
+
+OTHER_LABEL = "Other"
+# Aggregations whose per-category values can be summed into the "Other" bucket
+ADDITIVE_AGGREGATIONS = frozenset({"sum", "count"})
+
+
+def result_rows(payload: Dict) -> Tuple[Optional[str], List[Dict]]:
+    """(key, rows) of the row list in a data-lakehouse status payload, or (None, []) if there is none."""
+    for key in ROW_KEYS:
+        rows = payload.get(key)
+        if isinstance(rows, list):
+            return key, rows
+    return None, []
+
+
+def downsample_strategy(chart_type: str) -> str:
+    if chart_type in LTTB_CHARTS:
+        return "lttb"
+    if chart_type in BINNED_CHARTS:
+        return "bins"
+    if chart_type in TOP_N_CHARTS:
+        return "top_n"
+    return "truncate"
+
+
+def _as_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, Decimal):
+        # DECIMAL columns arrive as Decimal from DuckDB and Parquet
+        return float(value) if value.is_finite() else None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return float(value.toordinal())
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                return None
+    return None
+
+
+def _column(rows: List[Dict], name: Optional[str], position: int) -> Optional[str]:
+    """The encoded column if rows carry it, else the column at `position`."""
+    if name and name in rows[0]:
+        return name
+    columns = list(rows[0])
+    return columns[position] if len(columns) > position else None
+
+
+def lttb(rows: List[Dict], x: str, y: str, threshold: int) -> List[Dict]:
+    """
+    Largest-Triangle-Three-Buckets: keep `threshold` rows that preserve the visual
+    shape of the y-over-x line. Rows whose x is not numeric/temporal use their position.
+    """
+    n = len(rows)
+    if threshold >= n:
+        return rows
+    if threshold < 3:
+        # Too few points for triangles: keep the end points
+        return [rows[0], rows[-1]][:max(threshold, 0)]
+    xs = [_as_number(row.get(x)) for row in rows]
+    if any(value is None for value in xs):
+        xs = [float(index) for index in range(n)]
+    ys = [_as_number(row.get(y)) or 0.0 for row in rows]
+
+    sampled = [rows[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, n)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[index] - ys[a]) - (xs[a] - xs[index]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = index, area
+        sampled.append(rows[best])
+        a = best
+    sampled.append(rows[-1])
+    return sampled
+
+
+def histogram_bins(rows: List[Dict], column: str, bins: int) -> List[Dict]:
+    """Equal-width bins over `column` as {"bin_start", "bin_end", "count"} rows."""
+    values = [value for value in (_as_number(row.get(column)) for row in rows) if value is not None]
+    if not values or bins < 1:
+        return []
+    low, high = min(values), max(values)
+    width = (high - low) / bins or 1.0
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / width), bins - 1)] += 1
+    return [
+        {"bin_start": low + index * width, "bin_end": low + (index + 1) * width, "count": count}
+        for index, count in enumerate(counts)
+    ]
+
+
+def top_n_with_other(
+    rows: List[Dict],
+    category: str,
+    value: str,
+    limit: int,
+    color: Optional[str] = None,
+    fold_other: bool = True,
+) -> List[Dict]:
+    """
+    Keep the categories with the largest summed `value` and fold the rest into one
+    "Other" category (per `color` series when there is one), returning at most `limit` rows.
+    With `fold_other=False` (values that do not add up, such as averages) the rest
+    is dropped instead and categories are ranked by their largest value.
+    """
+    series = list(OrderedDict.fromkeys(row.get(color) for row in rows)) if color else [None]
+    keep = max(1, limit // max(1, len(series)) - (1 if fold_other else 0))
+    totals: Dict[Any, float] = {}
+    for row in rows:
+        number = _as_number(row.get(value)) or 0.0
+        previous = totals.get(row.get(category))
+        if fold_other or previous is None:
+            totals[row.get(category)] = (previous or 0.0) + number
+        else:
+            totals[row.get(category)] = max(previous, number)
+    top = set(sorted(totals, key=totals.get, reverse=True)[:keep])
+
+    kept = [row for row in rows if row.get(category) in top]
+    if not fold_other:
+        return kept[:limit]
+    other: Dict[Any, float] = {}
+    for row in rows:
+        if row.get(category) not in top:
+            key = row.get(color) if color else None
+            other[key] = other.get(key, 0.0) + (_as_number(row.get(value)) or 0.0)
+    for key, total in other.items():
+        row = {category: OTHER_LABEL, value: total}
+        if color:
+            row[color] = key
+        kept.append(row)
+    return kept[:limit]
+
+
+def series_budgets(sizes: List[int], total: int) -> List[int]:
+    """
+    Split `total` rows across series of the given sizes: equal shares, with what a
+    short series does not use handed on to the longer ones.
+    """
+    budgets = [0] * len(sizes)
+    remaining = total
+    pending = sorted(range(len(sizes)), key=lambda index: sizes[index])
+    while pending:
+        share = remaining // len(pending)
+        index = pending.pop(0)
+        budgets[index] = min(sizes[index], share)
+        remaining -= budgets[index]
+    return budgets
+
+
+def query_aggregation(query: Optional[Dict], column: Optional[str]) -> Optional[str]:
+    """Aggregation of the select item producing `column` (by alias or name) in a QuerySpec."""
+    for item in (query or {}).get("select") or []:
+        if isinstance(item, dict) and column in (item.get("as"), item.get("column")):
+            aggregation = item.get("aggregation")
+            return str(aggregation).strip().lower() if aggregation else None
+    return None
+
+
+def _is_aggregated(query: Optional[Dict]) -> bool:
+    if not query:
+        return False
+    return bool(query.get("groupBy")) or any(
+        isinstance(item, dict) and item.get("aggregation") for item in query.get("select") or []
+    )
+
+
+def reduce_rows(
+    rows: List[Dict],
+    chart_type: str,
+    encoding: Dict,
+    max_rows: int,
+    query: Optional[Dict] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Bring `rows` within `max_rows` using the chart type's strategy. `query` is the
+    chart's QuerySpec: it tells whether values may be folded into "Other" and
+    whether histogram rows are raw values (always binned, whatever their count).
+    Returns (rows, strategy) where strategy is None when nothing was reduced.
+    """
+    if not rows:
+        return rows, None
+    strategy = downsample_strategy(chart_type)
+    encoding = encoding or {}
+    x = _column(rows, encoding.get("x"), 0)
+    # Raw histogram values are binned at every size so the response shape never depends on the row count
+    if strategy == "bins" and x and not _is_aggregated(query):
+        bins = histogram_bins(rows, x, min(max_rows, len(rows)))
+        if bins:
+            return bins, strategy
+        # No numeric or temporal x to bin (e.g. a categorical column): keep the rows, truncated
+        strategy = "truncate"
+    if len(rows) <= max_rows:
+        return rows, None
+    y = _column(rows, encoding.get("y"), 1)
+    color = encoding.get("color") if encoding.get("color") in rows[0] else None
+
+    if strategy == "lttb" and x and y:
+        if color:
+            groups: "OrderedDict[Any, List[Dict]]" = OrderedDict()
+            for row in rows:
+                groups.setdefault(row.get(color), []).append(row)
+            budgets = series_budgets([len(group) for group in groups.values()], max_rows)
+            reduced = [
+                row for group, budget in zip(groups.values(), budgets) for row in lttb(group, x, y, budget)
+            ]
+            return reduced, strategy
+        return lttb(rows, x, y, max_rows), strategy
+    if strategy == "top_n" and x and y:
+        fold_other = query_aggregation(query, y) in ADDITIVE_AGGREGATIONS
+        return top_n_with_other(rows, x, y, max_rows, color, fold_other=fold_other), strategy
+    return rows[:max_rows], "truncate"
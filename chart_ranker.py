@@ -0,0 +1,81 @@
+# chart_ranker.py
+
+import math
+import re
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from chart_catalog import ChartRecord
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+    a an and are as at be by e g for from how i in into is it me my of on or our show
+    that the their them these this to use using vs want what which with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords dropped and a light plural strip."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _chart_document(record: ChartRecord) -> str:
+    parts = [record.name.replace("_", " "), record.title]
+    parts.extend(record.why)
+    parts.extend(record.use_cases)
+    return " ".join(parts)
+
+
+class ChartRanker:
+    """
+    CPU-only TF-IDF index over each chart's name, title, why and use_cases.
+    The index is an L2-normalized (charts x vocabulary) matrix built once, so
+    ranking a prompt is one sparse-to-dense vector and a matrix-vector product.
+    """
+
+    def __init__(self, records: Sequence[ChartRecord]):
+        self.charts = list(records)
+        documents = [Counter(tokenize(_chart_document(chart))) for chart in self.charts]
+        vocabulary = sorted({token for doc in documents for token in doc})
+        self.vocabulary = {token: index for index, token in enumerate(vocabulary)}
+
+        document_frequency = np.zeros(len(vocabulary), dtype=np.float32)
+        for doc in documents:
+            for token in doc:
+                document_frequency[self.vocabulary[token]] += 1
+        # Smoothed IDF as in scikit-learn
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+
+        matrix = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        for row, doc in enumerate(documents):
+            for token, count in doc.items():
+                matrix[row, self.vocabulary[token]] = 1 + math.log(count)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for token, count in Counter(tokenize(text)).items():
+            index = self.vocabulary.get(token)
+            if index is not None:
+                vector[index] = 1 + math.log(count)
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def rank(self, prompt: str, top_k: int = 5) -> List[Tuple[ChartRecord, float]]:
+        """Return up to `top_k` (chart record, cosine score) pairs, best first."""
+        scores = self.matrix @ self._vectorize(prompt)
+        top_k = min(max(top_k, 0), len(self.charts))
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(self.charts[index], float(scores[index])) for index in order]
@@ -0,0 +1,227 @@
+# chart_rules.py
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+NUMERIC_MEASURE = "numeric_measure"
+CATEGORICAL_DIMENSION = "categorical_dimension"
+DATETIME = "datetime"
+
+# data_requirements keys that describe constraints rather than a column role
+_NON_ROLE_KEYS = {"optional", "not_supported", "requirement", "conversion", "colors", "color", "aggregation"}
+_TYPE_RE = re.compile(r"^\s*([a-z_ ]+)")
+_NUMERIC_TYPES = {
+    "tinyint", "smallint", "int", "integer", "bigint", "long", "short", "byte",
+    "float", "double", "real", "decimal", "numeric", "number", "hugeint",
+}
+_DATETIME_TYPES = {"date", "timestamp", "timestamp_ntz", "timestamp_ltz", "datetime", "time"}
+_CATEGORICAL_TYPES = {"string", "varchar", "char", "text", "boolean", "bool"}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_AGGREGATION_WORDS = [
+    ("count_distinct", ("distinct", "unique")),
+    # "number" only counts as the phrase "number of"; "as a big number" names the chart
+    ("count", ("count", "many", "frequency")),
+    ("avg", ("average", "avg", "mean")),
+    ("max", ("max", "maximum")),
+    ("min", ("min", "minimum")),
+]
+# Words that usually mean a filter, ranking or window the rules cannot express.
+# Superlatives ("highest revenue region") rank groups by their total rather than asking for max().
+_FILTER_WORDS = {
+    "where", "only", "except", "excluding", "without", "between", "top", "bottom",
+    "last", "first", "since", "before", "after", "during", "filter", "filtered", "vs", "versus",
+    "highest", "lowest", "largest", "smallest", "biggest", "peak", "most", "least", "best", "worst",
+}
+
+
+def column_kind(data_type: Any) -> Optional[str]:
+    """Role a column of this SQL type can fill, or None when the type is unknown."""
+    match = _TYPE_RE.match(str(data_type or "").lower())
+    base = match.group(1).strip() if match else ""
+    if base in _NUMERIC_TYPES:
+        return NUMERIC_MEASURE
+    if base in _DATETIME_TYPES:
+        return DATETIME
+    if base in _CATEGORICAL_TYPES:
+        return CATEGORICAL_DIMENSION
+    return None
+
+
+_ROLE_WORD_RES = [
+    (DATETIME, re.compile(r"\b(time|times|timestamps?|dates?|days|months|years)\b")),
+    (CATEGORICAL_DIMENSION, re.compile(r"categor|discrete")),
+    (NUMERIC_MEASURE, re.compile(r"numer|count")),
+]
+
+
+def requirement_role(text: Any) -> Optional[str]:
+    """Typed role for one data_requirements entry: the role whose wording appears first."""
+    text = str(text).lower()
+    found = [(match.start(), role) for role, pattern in _ROLE_WORD_RES for match in [pattern.search(text)] if match]
+    return min(found)[1] if found else None
+
+
+def derive_role_requirements(chart: Dict) -> Dict[str, Optional[str]]:
+    """{requirement key: typed role} for a charts_config entry; None where the wording is not typed."""
+    requirements = chart.get("data_requirements") or {}
+    roles: Dict[str, Optional[str]] = {}
+    for key, text in requirements.items():
+        if key in _NON_ROLE_KEYS:
+            continue
+        if isinstance(text, dict):
+            for inner_key, inner_text in text.items():
+                if key != "optional":
+                    roles[inner_key] = requirement_role(inner_text)
+            continue
+        roles[key] = requirement_role(text)
+    return roles
+
+
+# Charts the rules build directly: the data_requirements key filling each slot (None: slot unused)
+RULE_TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "bar_chart": {"dimension": "x_axis", "measure": "y_axis"},
+    "pie_chart": {"dimension": "categories", "measure": "values"},
+    "line_chart": {"dimension": "x_axis", "measure": "y_axis"},
+    "histogram": {"dimension": None, "measure": "x_axis"},
+    "big_number": {"dimension": None, "measure": "value"},
+}
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower().replace("_", " "))
+
+
+def _aggregation(words: List[str]) -> str:
+    """Aggregation the prompt's words ask for, sum when none is named."""
+    word_set = set(words)
+    for name, keywords in _AGGREGATION_WORDS:
+        if word_set.intersection(keywords):
+            return name
+    if any(word == "number" and following == "of" for word, following in zip(words, words[1:])):
+        return "count"
+    return "sum"
+
+
+def _mentioned(column: str, prompt_words: set) -> bool:
+    words = _words(column)
+    return bool(words) and all(word in prompt_words for word in words)
+
+
+class RuleQueryBuilder:
+    """
+    Deterministic column-to-role matching for common charts. Roles come from each
+    chart's data_requirements; columns are matched by their schema data_type and
+    by being named in the prompt. build() returns a chart in the LLM builder's
+    output shape, "skip" when the table cannot satisfy the chart, or "ambiguous"
+    when more than one mapping fits and the LLM should decide.
+    """
+
+    def __init__(self, records: Iterable[Any]):
+        # `records` are chart_catalog.ChartRecord objects, whose roles are derived once per catalog load
+        self.charts: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            template = RULE_TEMPLATES.get(record.name)
+            if template is None:
+                continue
+            entry = {"name": record.name, "chart_id": record.chart_id, "slots": {}}
+            for slot, key in template.items():
+                if key is not None:
+                    entry["slots"][slot] = record.roles.get(key)
+            self.charts[str(record.chart_id)] = entry
+            self.charts[str(record.name)] = entry
+        self.built = 0
+        self.skipped = 0
+        self.ambiguous = 0
+
+    def build(self, prompt: str, chart_id: Any, columns: List[Tuple[str, Optional[str]]]) -> Tuple[str, Optional[Dict]]:
+        """
+        ("built", chart), ("skip", None) or ("ambiguous", None) for one suggested chart.
+        `columns` is [(name, column_kind(data_type))]; columns of unknown type are never chosen.
+        """
+        entry = self.charts.get(str(chart_id))
+        words = _words(prompt)
+        prompt_words = set(words)
+        if entry is None or not columns or prompt_words & _FILTER_WORDS or any(word.isdigit() for word in prompt_words):
+            self.ambiguous += 1
+            return "ambiguous", None
+
+        aggregation = _aggregation(words)
+        chosen: Dict[str, str] = {}
+        for slot, role in entry["slots"].items():
+            if role is None:
+                self.ambiguous += 1
+                return "ambiguous", None
+            candidates = [name for name, kind in columns if kind == role and name not in chosen.values()]
+            mentioned = [name for name in candidates if _mentioned(name, prompt_words)]
+            if len(mentioned) == 1:
+                chosen[slot] = mentioned[0]
+            elif slot == "measure" and aggregation == "count" and "dimension" in chosen and not mentioned:
+                # "number of orders per region" counts rows per group; no numeric column needed
+                chosen[slot] = chosen["dimension"]
+            elif len(candidates) == 1 and not mentioned:
+                chosen[slot] = candidates[0]
+            elif not candidates and all(kind is not None for _, kind in columns):
+                self.skipped += 1
+                return "skip", None
+            else:
+                self.ambiguous += 1
+                return "ambiguous", None
+
+        # A column the prompt names but no slot took (e.g. a date asked for on a bar chart) needs the LLM
+        if any(_mentioned(name, prompt_words) and name not in chosen.values() for name, _ in columns):
+            self.ambiguous += 1
+            return "ambiguous", None
+
+        self.built += 1
+        return "built", {
+            "user_prompt": prompt,
+            "chart_id": entry["chart_id"],
+            "chart_type": entry["name"],
+            "query": self._query(entry["name"], chosen, aggregation),
+            "encoding": self._encoding(entry["name"], chosen, aggregation),
+            "builder": "rules",
+        }
+
+    @staticmethod
+    def _measure_alias(measure: str, aggregation: str) -> str:
+        return f"{aggregation}_{measure}"
+
+    def _query(self, chart_type: str, chosen: Dict[str, str], aggregation: str) -> Dict:
+        measure = chosen["measure"]
+        query: Dict[str, Any] = {
+            "source": "uploaded_file",
+            "select": [],
+            "filters": [],
+            "groupBy": [],
+            "orderBy": [],
+            "limit": None,
+        }
+        if chart_type == "histogram":
+            # Raw values; the response is binned by chart_data.reduce_rows
+            query["select"] = [{"column": measure}]
+            return query
+        alias = self._measure_alias(measure, aggregation)
+        measure_item = {"column": measure, "aggregation": aggregation, "as": alias}
+        if chart_type == "big_number":
+            query["select"] = [measure_item]
+            return query
+        dimension = chosen["dimension"]
+        query["select"] = [{"column": dimension}, measure_item]
+        query["groupBy"] = [dimension]
+        if chart_type == "line_chart":
+            query["orderBy"] = [{"column": dimension, "direction": "asc"}]
+        else:
+            query["orderBy"] = [{"column": alias, "direction": "desc"}]
+        return query
+
+    def _encoding(self, chart_type: str, chosen: Dict[str, str], aggregation: str) -> Dict[str, str]:
+        measure = chosen["measure"]
+        if chart_type == "histogram":
+            return {"x": measure, "y": "", "color": ""}
+        alias = self._measure_alias(measure, aggregation)
+        if chart_type == "big_number":
+            return {"x": "", "y": alias, "color": ""}
+        return {"x": chosen["dimension"], "y": alias, "color": ""}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"built": self.built, "skipped": self.skipped, "ambiguous": self.ambiguous}
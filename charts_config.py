@@ -5,6 +5,7 @@ charts_config = [
     "chart_id": 1,
     "name": "bar_chart",
     "title": "Bar Chart",
+    "max_rows": 50,
     "why": [
       "To compare categories quickly and clearly",
       "To show counts, sums, or averages of different groups",
@@ -26,6 +27,7 @@ charts_config = [
     "chart_id": 2,
     "name": "heatmap",
     "title": "Heatmap",
+    "max_rows": 2500,
     "why": [
       "To highlight patterns and relationships quickly through colors",
       "To make large sets of values easier to compare visually",
@@ -48,6 +50,7 @@ charts_config = [
     "chart_id": 3,
     "name": "bubble_chart",
     "title": "Bubble Chart",
+    "max_rows": 2000,
     "why": [
       "To visualize relationships among three or more variables at once",
       "To compare entities not only by position but also by relative size",
@@ -71,6 +74,7 @@ charts_config = [
     "chart_id": 4,
     "name": "histogram",
     "title": "Histogram",
+    "max_rows": 100,
     "why": [
       "To understand the shape of data distribution (normal, skewed, uniform, etc.)",
       "To detect patterns like central tendency, spread, and outliers",
@@ -93,6 +97,7 @@ charts_config = [
     "chart_id": 5,
     "name": "scatter_plot",
     "title": "Scatter Plot",
+    "max_rows": 5000,
     "why": [
       "To visualize relationships or correlations between two variables",
       "To identify patterns, clusters, or outliers in data",
@@ -114,6 +119,7 @@ charts_config = [
     "chart_id": 6,
     "name": "pie_chart",
     "title": "Pie Chart",
+    "max_rows": 10,
     "why": [
       "To visualize proportions in a dataset",
       "To make it easy to see which category is the largest or smallest",
@@ -136,6 +142,7 @@ charts_config = [
     "chart_id": 7,
     "name": "calendar_heatmap",
     "title": "Calendar Heatmap",
+    "max_rows": 1100,
     "why": [
       "To visualize trends over time in a calendar layout",
       "To quickly spot daily, weekly, monthly, or seasonal patterns",
@@ -158,6 +165,7 @@ charts_config = [
   "chart_id": 8,
   "name": "box_plot",
   "title": "Box Plot",
+  "max_rows": 5000,
   "why": [
     "Useful for visualizing the spread and variability of a numeric variable.",
     "Helps compare distributions between multiple groups effectively.",
@@ -189,6 +197,7 @@ charts_config = [
     "chart_id": 9,
     "name": "line_chart",
     "title": "Line Chart",
+    "max_rows": 1000,
     "why": [
       "To visualize trends and patterns over time",
       "To highlight increases, decreases, and fluctuations in data",
@@ -211,6 +220,7 @@ charts_config = [
     "chart_id": 10,
     "name": "big_number",
     "title": "Big Number",
+    "max_rows": 1,
     "why": [
       "To highlight the most important metric at a glance",
       "To help stakeholders quickly understand performance without digging into details",
@@ -232,6 +242,7 @@ charts_config = [
   "chart_id": 11,
   "name": "paired_t_test_table",
   "title": "Paired T-Test Table",
+  "max_rows": 1000,
   "why": [
     "To determine whether there is a statistically significant difference between two related samples",
     "To analyze changes over time within the same group",
@@ -253,6 +264,7 @@ charts_config = [
   "chart_id": 12,
   "name": "horizon_chart",
   "title": "Horizon Chart",
+  "max_rows": 1000,
   "why": [
     "To visualize large time-series datasets in a compact way",
     "To compare multiple time-series side by side without taking too much space",
@@ -276,6 +288,7 @@ charts_config = [
   "chart_id": 13,
   "name": "stepped_line_chart",
   "title": "Stepped Line Chart",
+  "max_rows": 1000,
   "why": [
     "To emphasize discrete changes instead of gradual trends",
     "Helps when data changes only at specific points (not continuously)",
@@ -298,6 +311,7 @@ charts_config = [
   "chart_id": 14,
   "name": "smooth_line_chart",
   "title": "Smooth Line Chart",
+  "max_rows": 1000,
   "why": [
     "To show trends over time in a more fluid and natural way",
     "To reduce the jagged look of a normal line chart, making patterns easier to see",
@@ -320,6 +334,7 @@ charts_config = [
   "chart_id": 15,
   "name": "waterfall_chart",
   "title": "Waterfall Chart",
+  "max_rows": 50,
   "why": [
     "To break down a total into its components of increase and decrease",
     "Makes it easy to see how individual factors contribute to the final outcome"
@@ -340,6 +355,7 @@ charts_config = [
   "chart_id": 16,
   "name": "area_chart",
   "title": "Area Chart",
+  "max_rows": 1000,
   "why": [
     "To visualize trends and changes over time",
     "To emphasize the magnitude of values by filling the area",
@@ -362,6 +378,7 @@ charts_config = [
   "chart_id": 17,
   "name": "big_number_with_trendline",
   "title": "Big Number with Trendline",
+  "max_rows": 500,
   "why": [
     "To highlight a key metric (e.g., total revenue, active users, sales today)",
     "To add context by showing how that metric has evolved historically",
@@ -384,6 +401,7 @@ charts_config = [
   "chart_id": 18,
   "name": "funnel_chart",
   "title": "Funnel Chart",
+  "max_rows": 20,
   "why": [
     "To track conversion rates or drop-offs between steps in a process",
     "Helps identify bottlenecks where most users/customers drop off",
@@ -406,6 +424,7 @@ charts_config = [
   "chart_id": 19,
   "name": "sunburst_chart",
   "title": "Sunburst Chart",
+  "max_rows": 500,
   "why": [
     "To visualize hierarchical relationships in data",
     "Makes it easy to see how categories are broken down into subcategories",
@@ -428,6 +447,7 @@ charts_config = [
   "chart_id": 20,
   "name": "tree_chart",
   "title": "Tree Chart",
+  "max_rows": 1000,
   "why": [
     "To represent hierarchical relationships clearly",
     "Helps in breaking down complex structures into simple levels",
@@ -450,6 +470,7 @@ charts_config = [
   "chart_id": 21,
   "name": "tree_map_chart",
   "title": "Tree Map",
+  "max_rows": 500,
   "why": [
     "To compare proportions between categories and subcategories",
     "To show hierarchical relationships while also comparing size and color metrics",
@@ -472,6 +493,7 @@ charts_config = [
   "chart_id": 22,
   "name": "radar_chart",
   "title": "Radar Chart",
+  "max_rows": 50,
   "why": [
     "To visualize multivariate data in a compact, easy-to-compare format",
     "Good for identifying strengths and weaknesses across categories",
@@ -494,6 +516,7 @@ charts_config = [
   "chart_id": 23,
   "name": "word_cloud",
   "title": "Word Cloud",
+  "max_rows": 200,
   "why": [
     "To quickly identify the most common words in a dataset",
     "Provides a visual summary of text data",
@@ -516,6 +539,7 @@ charts_config = [
   "chart_id": 24,
   "name": "pivot_table",
   "title": "Pivot Table",
+  "max_rows": 5000,
   "why": [
     "To quickly analyze large datasets and extract meaningful insights",
     "Makes it easy to slice and dice data from different perspectives",
@@ -0,0 +1,168 @@
+# jobs.py
+
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when the queue is at capacity."""
+
+
+class Job:
+    def __init__(self, fn: Callable[["Job"], Awaitable[Any]]):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Free-form progress the job function updates in place
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._fn = fn
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    In-process job queue drained by a fixed pool of asyncio workers.
+    The queue is bounded (submit raises JobQueueFull past `max_queue`) and
+    finished jobs are kept for `retention` seconds so clients can poll them,
+    but never more than the `max_finished` most recently finished ones.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 100, retention: float = 3600.0, max_finished: int = 1000):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.retention = retention
+        self.max_finished = max_finished
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self._jobs.values():
+            if not job.done:
+                self._finish(job, "cancelled", error="Service shutting down")
+
+    def submit(self, fn: Callable[[Job], Awaitable[Any]]) -> Job:
+        if self._queue is None:
+            raise RuntimeError("JobManager.start() has not been called")
+        self._prune()
+        job = Job(fn)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"Job queue is full ({self.max_queue} waiting)")
+        self._jobs[job.id] = job
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return job
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            # Still queued: the worker skips it when dequeued
+            self._finish(job, "cancelled")
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.done:
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                job._task = asyncio.ensure_future(job._fn(job))
+                try:
+                    # wait() leaves the job task alone if this worker is cancelled
+                    await asyncio.wait({job._task})
+                except asyncio.CancelledError:
+                    job._task.cancel()
+                    raise
+                if job._task.cancelled():
+                    self._finish(job, "cancelled")
+                elif job._task.exception() is not None:
+                    self._finish(job, "failed", error=_describe_error(job._task.exception()))
+                else:
+                    job.result = job._task.result()
+                    self._finish(job, "completed")
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job._task = None
+        setattr(self, status, getattr(self, status) + 1)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at)
+        surplus = max(0, len(finished) - self.max_finished)
+        for index, job in enumerate(finished):
+            if index < surplus or job.finished_at < cutoff:
+                del self._jobs[job.id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "running": sum(1 for job in self._jobs.values() if job.status == "running"),
+            "tracked": len(self._jobs),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+def _describe_error(error: BaseException) -> str:
+    # HTTPException carries its message in .detail
+    detail = getattr(error, "detail", None)
+    return str(detail) if detail is not None else f"{type(error).__name__}: {error}"
@@ -0,0 +1,71 @@
+# json_stream.py
+
+import json
+from typing import Any, Dict, List
+
+
+class ArrayItemParser:
+    """
+    Incremental parser for streamed LLM JSON: feed() text chunks as they arrive
+    and get back each object of the top-level `key` array (e.g. "charts") as soon
+    as its closing brace is seen. Text before the root object, such as a code
+    fence, is skipped. Objects that do not parse are skipped; `text` keeps the
+    whole output for a final full parse.
+    """
+
+    def __init__(self, key: str = "charts"):
+        self.key = key
+        self.text = ""
+        self.items_found = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = -1
+        self._last_string = None
+        self._in_array = False
+        self._item_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        items = []
+        text = self.text
+        for index in range(self._pos, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:index]
+                continue
+            if char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+                    self._string_start = index
+            elif char in "{[":
+                if self._depth == 0 and char != "{":
+                    continue
+                if char == "[" and self._depth == 1 and self._last_string == self.key:
+                    self._in_array = True
+                elif char == "{" and self._in_array and self._depth == 2:
+                    self._item_start = index
+                self._depth += 1
+            elif char in "}]" and self._depth > 0:
+                self._depth -= 1
+                if char == "}" and self._in_array and self._depth == 2 and self._item_start >= 0:
+                    try:
+                        item = json.loads(text[self._item_start:index + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        items.append(item)
+                        self.items_found += 1
+                    self._item_start = -1
+                elif char == "]" and self._in_array and self._depth == 1:
+                    self._in_array = False
+        self._pos = len(text)
+        return items
@@ -0,0 +1,243 @@
+# local_engine.py
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+AGGREGATIONS = {
+    "sum": "SUM({})",
+    "avg": "AVG({})",
+    "min": "MIN({})",
+    "max": "MAX({})",
+    "count": "COUNT({})",
+    "count_distinct": "COUNT(DISTINCT {})",
+}
+COMPARISONS = {"=", "!=", "<", "<=", ">", ">="}
+# Project and table names become path components of the extract files
+_SAFE_NAME_RE = re.compile(r"[A-Za-z0-9_\-]+")
+
+
+class UnsupportedQuery(ValueError):
+    """Raised for QuerySpec constructs the local engine does not translate."""
+
+
+def quote_identifier(name: Any) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def compile_query_spec(query_spec: Dict, relation: str) -> Tuple[str, List[Any]]:
+    """
+    Translate a QuerySpec (select with aggregations, filters, groupBy, orderBy,
+    limit) into DuckDB SQL over `relation`. Values are bound as parameters.
+    """
+    params: List[Any] = []
+    select = []
+    for item in query_spec.get("select") or []:
+        if isinstance(item, str):
+            item = {"column": item}
+        column = item.get("column")
+        if not column:
+            raise UnsupportedQuery(f"select item without a column: {item}")
+        aggregation = (item.get("aggregation") or "").lower()
+        if aggregation:
+            if aggregation not in AGGREGATIONS:
+                raise UnsupportedQuery(f"Unsupported aggregation '{aggregation}'")
+            expression = AGGREGATIONS[aggregation].format("*" if column == "*" else quote_identifier(column))
+        else:
+            expression = "*" if column == "*" else quote_identifier(column)
+        alias = item.get("as")
+        select.append(f"{expression} AS {quote_identifier(alias)}" if alias and expression != "*" else expression)
+
+    where = []
+    for item in query_spec.get("filters") or []:
+        column = quote_identifier(item.get("column"))
+        operator = str(item.get("operator", "=")).strip().lower()
+        value = item.get("value")
+        if operator in COMPARISONS:
+            where.append(f"{column} {operator} ?")
+            params.append(value)
+        elif operator == "in":
+            values = value if isinstance(value, list) else [value]
+            if not values:
+                where.append("FALSE")
+                continue
+            where.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        elif operator == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise UnsupportedQuery(f"between needs a [low, high] value, got {value!r}")
+            where.append(f"{column} BETWEEN ? AND ?")
+            params.extend(value)
+        elif operator == "contains":
+            where.append(f"CAST({column} AS VARCHAR) ILIKE ?")
+            params.append(f"%{value}%")
+        else:
+            raise UnsupportedQuery(f"Unsupported filter operator '{operator}'")
+
+    sql = f"SELECT {', '.join(select) or '*'} FROM {relation}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    group_by = query_spec.get("groupBy") or []
+    if group_by:
+        sql += " GROUP BY " + ", ".join(quote_identifier(column) for column in group_by)
+    order_by = query_spec.get("orderBy") or []
+    if isinstance(order_by, dict):
+        order_by = [order_by]
+    if order_by:
+        terms = []
+        for item in order_by:
+            direction = str(item.get("direction") or "asc").upper()
+            if direction not in ("ASC", "DESC"):
+                raise UnsupportedQuery(f"Unsupported order direction '{direction}'")
+            terms.append(f"{quote_identifier(item.get('column'))} {direction}")
+        sql += " ORDER BY " + ", ".join(terms)
+    limit = query_spec.get("limit")
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return sql, params
+
+
+class LocalQueryEngine:
+    """
+    Runs QuerySpecs with an embedded DuckDB against per-table Parquet extracts
+    kept under `directory`. A table is served locally only while its extract is
+    younger than `max_age` seconds and holds at most `max_rows` rows.
+    Blocking; call from a worker thread in async code. Requires duckdb and pyarrow.
+    """
+
+    def __init__(self, directory: str, max_rows: int = 1_000_000, max_age: float = 900.0):
+        import duckdb
+
+        self.directory = directory
+        self.max_rows = max_rows
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self._conn = duckdb.connect()
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.errors = 0
+        self.extracts_written = 0
+
+    @staticmethod
+    def supports_table(project_id: str, table_name: str) -> bool:
+        """Whether the names can be used as extract paths; other tables always go to the data-lakehouse."""
+        return bool(_SAFE_NAME_RE.fullmatch(project_id) and _SAFE_NAME_RE.fullmatch(table_name))
+
+    def _paths(self, project_id: str, table_name: str) -> Tuple[str, str]:
+        if not self.supports_table(project_id, table_name):
+            raise ValueError(f"Invalid project or table name: {project_id!r}.{table_name!r}")
+        base = os.path.join(self.directory, project_id, table_name)
+        return base + ".parquet", base + ".json"
+
+    def extract_info(self, project_id: str, table_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            _, meta_path = self._paths(project_id, table_name)
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def can_serve(self, project_id: str, table_name: str) -> bool:
+        info = self.extract_info(project_id, table_name)
+        return (
+            info is not None
+            and not info.get("too_large")
+            and info.get("rows", 0) <= self.max_rows
+            and time.time() - info.get("created_at", 0) < self.max_age
+        )
+
+    def needs_refresh(self, project_id: str, table_name: str) -> bool:
+        """
+        True when there is no extract, or it is stale (oversized tables are rechecked
+        after max_age too). A failed pull is not retried for max_age either.
+        """
+        info = self.extract_info(project_id, table_name)
+        if info is None:
+            return True
+        now = time.time()
+        if now - info.get("failed_at", 0) < self.max_age:
+            return False
+        return now - info.get("created_at", 0) >= self.max_age
+
+    def record_failure(self, project_id: str, table_name: str, error: str) -> Dict[str, Any]:
+        """Note a failed pull in the table's metadata, keeping any existing extract's details."""
+        _, meta_path = self._paths(project_id, table_name)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        info = {**(self.extract_info(project_id, table_name) or {}), "failed_at": time.time(), "error": error}
+        self._write_info(meta_path, info)
+        return info
+
+    def _write_info(self, meta_path: str, info: Dict[str, Any]) -> None:
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(info, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def write_extract_table(self, project_id: str, table_name: str, table: Any) -> Dict[str, Any]:
+        """
+        Store an Arrow table as the table's extract. More than `max_rows` rows only
+        records that the table is too large, so it keeps going to the data-lakehouse.
+        """
+        import pyarrow.parquet as pq
+
+        data_path, meta_path = self._paths(project_id, table_name)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        info: Dict[str, Any] = {"created_at": time.time(), "rows": table.num_rows}
+        if table.num_rows > self.max_rows:
+            info["too_large"] = True
+            self.drop_extract(project_id, table_name)
+        else:
+            tmp_path = data_path + ".tmp"
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, data_path)
+            info["bytes"] = os.path.getsize(data_path)
+            self.extracts_written += 1
+        self._write_info(meta_path, info)
+        return info
+
+    def drop_extract(self, project_id: str, table_name: str) -> bool:
+        try:
+            paths = self._paths(project_id, table_name)
+        except ValueError:
+            return False
+        removed = False
+        for path in paths:
+            try:
+                os.remove(path)
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def execute(self, query_spec: Dict, project_id: str, table_name: str) -> Dict[str, Any]:
+        """Run `query_spec` on the table's extract; returns a payload shaped like a completed lakehouse job."""
+        data_path, _ = self._paths(project_id, table_name)
+        relation = "read_parquet(" + "'" + data_path.replace("'", "''") + "')"
+        sql, params = compile_query_spec(query_spec, relation)
+        try:
+            with self._lock:
+                cursor = self._conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception:
+            self.errors += 1
+            raise
+        self.queries += 1
+        return {"status": "completed", "rowCount": len(rows), "resultData": rows, "resultSource": "local"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "max_rows": self.max_rows,
+            "max_age_seconds": self.max_age,
+            "queries": self.queries,
+            "errors": self.errors,
+            "extracts_written": self.extracts_written,
+        }
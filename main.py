@@ -1,14 +1,37 @@
 import uvicorn
 import os
 import json
+import hashlib
 import httpx
 import asyncio
-from fastapi import FastAPI, HTTPException
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from openai import AsyncOpenAI
-from typing import List, Dict, Any, Union, Optional
+from typing import List, Dict, Any, Union, Optional, Tuple, Callable, Literal, AsyncIterator, Awaitable, Type
 from dotenv import load_dotenv
-from charts_config import charts_config
+from caching import TTLCache, SQLiteCache, SingleFlight
+from chart_catalog import CatalogError, ChartCatalog, load_catalog
+from chart_ranker import ChartRanker
+from chart_rules import RuleQueryBuilder, column_kind
+from jobs import Job, JobManager, JobQueueFull
+from json_stream import ArrayItemParser
+from chart_data import downsample_strategy, reduce_rows, result_rows
+from parquet_results import ParquetResultReader, projected_columns
+from local_engine import LocalQueryEngine
+from prompt_compaction import build_compact_content, count_tokens
+from query_planner import FusedQuery, plan_fusion, project_rows
+from query_validation import QueryValidationError, schema_column_names, schema_columns, validate_query
+from response_encoding import (
+    UnsupportedFormat, arrow_available, encode_body, encode_chart_data, negotiate_encoding, negotiate_format,
+    serialize,
+)
 
 # --- Load .env ---
 load_dotenv()
@@ -18,6 +41,97 @@ API_KEY = os.getenv("OPENROUTER_API_KEY")
 BASE_URL = os.getenv("OPENROUTER_BASE_URL")
 MODEL = os.getenv("OPENROUTER_MODEL")
 DATALAKE_BASE_URL = os.getenv("DATALAKE_BASE_URL", "http://localhost:8080/api/v1")
+# Max LLM calls in flight per request, and per-call timeout in seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Stream the query builder's completion and run each chart's query as soon as its JSON object is complete
+LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() in ("1", "true", "yes")
+# Data-lakehouse chart queries: global and per-project in-flight caps, per-chart deadline in seconds
+DATALAKE_MAX_CONCURRENCY = int(os.getenv("DATALAKE_MAX_CONCURRENCY", "8"))
+DATALAKE_PROJECT_MAX_CONCURRENCY = int(os.getenv("DATALAKE_PROJECT_MAX_CONCURRENCY", "4"))
+CHART_QUERY_DEADLINE = float(os.getenv("CHART_QUERY_DEADLINE", "90"))
+# Fuse aggregate chart queries that share a source and filters into one query grouped by at most this many columns
+QUERY_FUSION = os.getenv("QUERY_FUSION", "true").lower() in ("1", "true", "yes")
+QUERY_FUSION_MAX_GROUP_COLUMNS = int(os.getenv("QUERY_FUSION_MAX_GROUP_COLUMNS", "3"))
+# Row cap for chart types without "max_rows" in charts_config
+CHART_DEFAULT_MAX_ROWS = int(os.getenv("CHART_DEFAULT_MAX_ROWS", "5000"))
+# Chart responses smaller than this are sent uncompressed even when the client accepts gzip/br
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+# Serialize chart responses directly (orjson when installed) instead of re-validating them against response_model
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "true").lower() in ("1", "true", "yes")
+# Shared data-lakehouse connection pool
+DATALAKE_MAX_CONNECTIONS = int(os.getenv("DATALAKE_MAX_CONNECTIONS", "50"))
+DATALAKE_MAX_KEEPALIVE = int(os.getenv("DATALAKE_MAX_KEEPALIVE", "20"))
+DATALAKE_KEEPALIVE_EXPIRY = float(os.getenv("DATALAKE_KEEPALIVE_EXPIRY", "30"))
+DATALAKE_HTTP2 = os.getenv("DATALAKE_HTTP2", "false").lower() in ("1", "true", "yes")
+# Job polling: adaptive (backoff + jitter), fixed (1s), longpoll or sse (fall back to adaptive if unsupported)
+JOB_POLL_MODE = os.getenv("JOB_POLL_MODE", "adaptive").lower()
+JOB_POLL_INITIAL_INTERVAL = float(os.getenv("JOB_POLL_INITIAL_INTERVAL", "0.1"))
+JOB_POLL_MAX_INTERVAL = float(os.getenv("JOB_POLL_MAX_INTERVAL", "2.0"))
+JOB_POLL_BACKOFF = float(os.getenv("JOB_POLL_BACKOFF", "2.0"))
+JOB_POLL_JITTER = float(os.getenv("JOB_POLL_JITTER", "0.2"))
+DATALAKE_LONGPOLL_PARAM = os.getenv("DATALAKE_LONGPOLL_PARAM", "wait")
+DATALAKE_LONGPOLL_MAX_WAIT = float(os.getenv("DATALAKE_LONGPOLL_MAX_WAIT", "20"))
+DATALAKE_JOB_EVENTS_PATH = os.getenv("DATALAKE_JOB_EVENTS_PATH", "/query/{job_id}/events")
+# Table schema cache
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "300"))
+SCHEMA_CACHE_MAXSIZE = int(os.getenv("SCHEMA_CACHE_MAXSIZE", "256"))
+# LLM response cache: memory tier, plus an optional SQLite tier when LLM_CACHE_PATH is set
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAXSIZE = int(os.getenv("LLM_CACHE_MAXSIZE", "1024"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+LLM_CACHE_DISK_TTL = float(os.getenv("LLM_CACHE_DISK_TTL", "86400"))
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "10000"))
+# Query result cache, bounded by entry count and total serialized bytes
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_MAXSIZE = int(os.getenv("QUERY_CACHE_MAXSIZE", "512"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Query results: "json" rows from the job status endpoint, or "parquet" read directly from object storage
+RESULT_FETCH_MODE = os.getenv("RESULT_FETCH_MODE", "json").lower()
+RESULT_PARQUET_URI = os.getenv("RESULT_PARQUET_URI", "s3://warehouse/wh/{project_id}/queries/{job_id}/data.parquet")
+RESULT_S3_ENDPOINT = os.getenv("RESULT_S3_ENDPOINT", "http://localhost:9000")
+RESULT_S3_ACCESS_KEY = os.getenv("RESULT_S3_ACCESS_KEY")
+RESULT_S3_SECRET_KEY = os.getenv("RESULT_S3_SECRET_KEY")
+RESULT_S3_REGION = os.getenv("RESULT_S3_REGION", "us-east-1")
+# Extra query string sent on status polls in parquet mode, e.g. to have the data-lakehouse omit result rows
+RESULT_PARQUET_STATUS_PARAMS = os.getenv("RESULT_PARQUET_STATUS_PARAMS", "")
+# Embedded DuckDB engine over local Parquet extracts for small, recently extracted tables
+LOCAL_ENGINE_ENABLED = os.getenv("LOCAL_ENGINE", "false").lower() in ("1", "true", "yes")
+LOCAL_ENGINE_DIR = os.getenv("LOCAL_ENGINE_DIR", ".extracts")
+LOCAL_ENGINE_MAX_ROWS = int(os.getenv("LOCAL_ENGINE_MAX_ROWS", "1000000"))
+LOCAL_ENGINE_MAX_AGE = float(os.getenv("LOCAL_ENGINE_MAX_AGE", "900"))
+LOCAL_ENGINE_AUTO_EXTRACT = os.getenv("LOCAL_ENGINE_AUTO_EXTRACT", "true").lower() in ("1", "true", "yes")
+# Extract pulls read the job's Parquet result under their own deadline and concurrency cap
+LOCAL_ENGINE_PULL_TIMEOUT = float(os.getenv("LOCAL_ENGINE_PULL_TIMEOUT", "600"))
+LOCAL_ENGINE_PULL_CONCURRENCY = int(os.getenv("LOCAL_ENGINE_PULL_CONCURRENCY", "1"))
+# Chart catalog file (JSON or YAML list of charts); empty loads charts_config.py
+CHARTS_CONFIG_PATH = os.getenv("CHARTS_CONFIG_PATH", "")
+# Chart suggestion: "llm" sends the top-k locally ranked charts to the LLM (0 = whole catalog),
+# "local" answers from the ranker alone without any LLM call
+SUGGEST_MODE = os.getenv("SUGGEST_MODE", "llm").lower()
+CHART_RANKER_TOP_K = int(os.getenv("CHART_RANKER_TOP_K", "0"))
+# General-purpose charts sent with every ranked subset, whatever their score
+CHART_RANKER_ALWAYS_INCLUDE = [
+    name.strip() for name in os.getenv("CHART_RANKER_ALWAYS_INCLUDE", "bar_chart,line_chart,pie_chart").split(",") if name.strip()
+]
+CHART_RANKER_LOCAL_TOP_K = int(os.getenv("CHART_RANKER_LOCAL_TOP_K", "3"))
+CHART_RANKER_MIN_SCORE = float(os.getenv("CHART_RANKER_MIN_SCORE", "0.05"))
+# Query building: "rules" maps columns to roles locally for common charts and asks the LLM only
+# about charts the rules find ambiguous; "llm" sends every suggested chart to the LLM
+BUILD_MODE = os.getenv("BUILD_MODE", "rules").lower()
+# Query-builder prompt: send only the suggested charts and compact, relevance-sorted columns
+# (name + type), dropping the least relevant columns past the token budget (0 = no budget)
+BUILD_PROMPT_COMPACTION = os.getenv("BUILD_PROMPT_COMPACTION", "true").lower() in ("1", "true", "yes")
+BUILD_PROMPT_TOKEN_BUDGET = int(os.getenv("BUILD_PROMPT_TOKEN_BUDGET", "6000"))
+# Batch mode packs several prompts into one suggestion call, split by a token budget counted like the query-builder prompt's
+SUGGEST_BATCH = os.getenv("SUGGEST_BATCH", "false").lower() in ("1", "true", "yes")
+SUGGEST_BATCH_TOKEN_BUDGET = int(os.getenv("SUGGEST_BATCH_TOKEN_BUDGET", "6000"))
+SUGGEST_BATCH_MAX_PROMPTS = int(os.getenv("SUGGEST_BATCH_MAX_PROMPTS", "16"))
+# Background chart-generation jobs: worker count, queue bound (429 past it), seconds finished jobs are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAXSIZE = int(os.getenv("JOB_QUEUE_MAXSIZE", "100"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "1000"))
 
 
 if not API_KEY:
@@ -28,67 +142,601 @@ CLIENT = AsyncOpenAI(
     api_key=API_KEY
 )
 
+# --- Data-Lakehouse HTTP Client ---
+_DATALAKE_CLIENT: Optional[httpx.AsyncClient] = None
+_POOL_STATS = {"requests_total": 0, "errors_total": 0, "in_flight": 0, "peak_in_flight": 0}
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Counts requests going through the shared pool for /metrics."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _POOL_STATS["requests_total"] += 1
+        _POOL_STATS["in_flight"] += 1
+        _POOL_STATS["peak_in_flight"] = max(_POOL_STATS["peak_in_flight"], _POOL_STATS["in_flight"])
+        try:
+            return await super().handle_async_request(request)
+        except Exception:
+            _POOL_STATS["errors_total"] += 1
+            raise
+        finally:
+            _POOL_STATS["in_flight"] -= 1
+
+
+def create_datalake_client() -> httpx.AsyncClient:
+    """Build the pooled client used for all data-lakehouse traffic."""
+    http2 = DATALAKE_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("DATALAKE_HTTP2 requested but 'h2' is not installed (pip install httpx[http2]); using HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=DATALAKE_MAX_CONNECTIONS,
+        max_keepalive_connections=DATALAKE_MAX_KEEPALIVE,
+        keepalive_expiry=DATALAKE_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        timeout=60.0,
+        transport=_InstrumentedTransport(limits=limits, http2=http2),
+    )
+
+
+def get_datalake_client() -> httpx.AsyncClient:
+    """Return the app-lifetime client, creating it lazily when used outside the lifespan."""
+    global _DATALAKE_CLIENT
+    if _DATALAKE_CLIENT is None or _DATALAKE_CLIENT.is_closed:
+        _DATALAKE_CLIENT = create_datalake_client()
+    return _DATALAKE_CLIENT
+
+
+def datalake_pool_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = dict(_POOL_STATS)
+    stats["max_connections"] = DATALAKE_MAX_CONNECTIONS
+    stats["max_keepalive_connections"] = DATALAKE_MAX_KEEPALIVE
+    connections = []
+    if _DATALAKE_CLIENT is not None:
+        pool = getattr(_DATALAKE_CLIENT._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+    stats["connections_open"] = len(connections)
+    stats["connections_idle"] = sum(1 for conn in connections if conn.is_idle())
+    stats["connections_active"] = stats["connections_open"] - stats["connections_idle"]
+    return stats
+
+
+# --- Background Jobs ---
+JOBS = JobManager(workers=JOB_WORKERS, max_queue=JOB_QUEUE_MAXSIZE, retention=JOB_RETENTION, max_finished=JOB_MAX_FINISHED)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _DATALAKE_CLIENT
+    _DATALAKE_CLIENT = create_datalake_client()
+    JOBS.start()
+    try:
+        yield
+    finally:
+        await JOBS.stop()
+        await _DATALAKE_CLIENT.aclose()
+        _DATALAKE_CLIENT = None
+
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Chart Generation Assistant API",
     description="An API that suggests charts and builds queries based on user prompts and metadata.",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+)
+
+
+# --- Job Waiter ---
+_TERMINAL_JOB_STATUSES = ("completed", "failed")
+# Flipped off the first time the data-lakehouse rejects long-poll / SSE, so later jobs go straight to polling
+_JOB_WAIT_SUPPORT = {"longpoll": True, "sse": True}
+
+
+def _job_retry_hint(response: httpx.Response, payload: Dict) -> Optional[float]:
+    """Seconds until the next poll as suggested by `Retry-After` or an ETA field in the body."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(retry_after)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    for key in ("retryAfter", "etaSeconds", "eta_seconds"):
+        value = payload.get(key)
+        if isinstance(value, (int, float)):
+            return max(0.0, float(value))
+    return None
+
+
+async def _wait_for_job_events(client: httpx.AsyncClient, job_id: str, remaining: float, strict: bool = True) -> Optional[Dict]:
+    """
+    Follow the job's server-sent-event stream until it reports a terminal status.
+    Returns the final status payload, or None when no stream is available.
+    """
+    url = DATALAKE_BASE_URL + DATALAKE_JOB_EVENTS_PATH.format(job_id=job_id)
+    async with client.stream("GET", url, timeout=remaining, headers={"Accept": "text/event-stream"}) as response:
+        if response.status_code in (400, 404, 405, 501):
+            _JOB_WAIT_SUPPORT["sse"] = False
+            print(f"Data-lakehouse has no job event stream ({response.status_code}); falling back to polling")
+            return None
+        if not strict and response.status_code < 500 and response.is_error:
+            return None
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            try:
+                event = json.loads(line[5:].strip())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(event, dict) and event.get("status") in _TERMINAL_JOB_STATUSES:
+                break
+        else:
+            return None
+    # Events may omit the result rows, so read the final status once
+    status_response = await client.get(f"{DATALAKE_BASE_URL}/query/{job_id}", timeout=remaining)
+    return _job_status_payload(status_response, strict)
+
+
+def _job_status_payload(response: httpx.Response, strict: bool) -> Dict:
+    """
+    Parsed body of one job status response. Strict callers get httpx errors for
+    any non-2xx status or non-JSON body; lenient ones only for 5xx, and keep
+    polling through client errors and unparseable bodies.
+    """
+    if strict or response.status_code >= 500:
+        response.raise_for_status()
+    try:
+        payload = response.json()
+    except ValueError as e:
+        if strict:
+            raise httpx.DecodingError(f"Invalid job status body: {e}", request=response.request)
+        return {"_raw_text": response.text}
+    return payload if isinstance(payload, dict) else {"_raw_text": response.text}
+
+
+async def wait_for_job(
+    job_id: str,
+    timeout: float,
+    mode: str = JOB_POLL_MODE,
+    params: Optional[Dict[str, str]] = None,
+    strict: bool = True,
+) -> Dict:
+    """
+    Wait for a data-lakehouse job to finish and return its final status payload
+    ("completed" or "failed").
+    - "adaptive": short first interval, exponential backoff with jitter, honors Retry-After / ETA hints.
+    - "longpoll" / "sse": let the data-lakehouse hold the request; falls back to adaptive if unsupported.
+    - "fixed": the original one-second interval.
+    `params` are added to every status request. `strict=False` keeps the schema
+    lookup's tolerance of 4xx and non-JSON status responses.
+    Raises asyncio.TimeoutError past `timeout` and httpx.HTTPError on transport/HTTP errors.
+    """
+    params = params or {}
+    client = get_datalake_client()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    if mode == "sse" and _JOB_WAIT_SUPPORT["sse"]:
+        payload = await asyncio.wait_for(_wait_for_job_events(client, job_id, timeout, strict), timeout=timeout)
+        if payload is not None:
+            return payload
+
+    fixed = mode == "fixed"
+    interval = 1.0 if fixed else JOB_POLL_INITIAL_INTERVAL
+    url = f"{DATALAKE_BASE_URL}/query/{job_id}"
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+
+        if mode == "longpoll" and _JOB_WAIT_SUPPORT["longpoll"]:
+            wait = min(remaining, DATALAKE_LONGPOLL_MAX_WAIT)
+            # Grace for the server to answer after holding the request, but never past the caller's deadline
+            response = await client.get(
+                url, params={**params, DATALAKE_LONGPOLL_PARAM: f"{wait:.0f}"}, timeout=min(wait + 5, remaining)
+            )
+            if response.status_code in (400, 404, 405, 501):
+                _JOB_WAIT_SUPPORT["longpoll"] = False
+                print(f"Data-lakehouse rejected long-poll ({response.status_code}); falling back to polling")
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                response = await client.get(url, params=params, timeout=remaining)
+        else:
+            response = await client.get(url, params=params, timeout=remaining)
+        payload = _job_status_payload(response, strict)
+        if payload.get("status") in _TERMINAL_JOB_STATUSES:
+            return payload
+
+        if fixed:
+            delay = interval
+        else:
+            delay = _job_retry_hint(response, payload)
+            if delay is None:
+                delay = interval * random.uniform(1 - JOB_POLL_JITTER, 1 + JOB_POLL_JITTER)
+                interval = min(interval * JOB_POLL_BACKOFF, JOB_POLL_MAX_INTERVAL)
+            else:
+                # A "Retry-After: 0" or zero ETA must not turn polling into a tight loop
+                delay = max(delay, JOB_POLL_INITIAL_INTERVAL)
+        await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+
+
+# --- Query Result Cache ---
+_RESULT_SIZE_SAMPLE_ROWS = 16
+# Spec fields holding identifiers or keywords; filter values are data and stay byte-exact
+_IDENTIFIER_FIELDS = ("column", "as")
+_KEYWORD_FIELDS = ("aggregation", "operator", "direction")
+
+
+def estimate_result_size(result: Dict) -> int:
+    """
+    Approximate JSON size of a status payload: the serialized size of a few rows
+    scaled to the row count, so sizing a large result stays cheap on the event loop.
+    """
+    _, rows = result_rows(result)
+    if not rows:
+        return len(json.dumps(result, default=str))
+    step = max(1, len(rows) // _RESULT_SIZE_SAMPLE_ROWS)
+    sample = rows[::step][:_RESULT_SIZE_SAMPLE_ROWS]
+    sample_bytes = len(json.dumps(sample, default=str))
+    return sample_bytes * len(rows) // len(sample) + 256
+
+
+QUERY_CACHE = TTLCache(
+    maxsize=QUERY_CACHE_MAXSIZE,
+    ttl=QUERY_CACHE_TTL,
+    max_bytes=QUERY_CACHE_MAX_BYTES,
+    sizeof=estimate_result_size,
 )
+
+
+def _normalize_query_item(item: Any) -> Any:
+    """Strip identifiers, lowercase keywords and drop redundant aliases in one select/filter/orderBy entry."""
+    if isinstance(item, str):
+        return item.strip()
+    if not isinstance(item, dict):
+        return item
+    normalized = {}
+    for key, value in item.items():
+        if isinstance(value, str):
+            if key in _IDENTIFIER_FIELDS:
+                value = value.strip()
+            elif key in _KEYWORD_FIELDS:
+                value = value.strip().lower()
+        normalized[key] = value
+    if normalized.get("as") in (None, "") or (normalized.get("as") == normalized.get("column") and not normalized.get("aggregation")):
+        normalized.pop("as", None)
+    if normalized.get("operator") == "in" and isinstance(normalized.get("value"), list):
+        normalized["value"] = sorted(normalized["value"], key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    if "direction" in normalized and normalized["direction"] in (None, "", "asc"):
+        normalized.pop("direction")
+    return normalized
+
+
+def canonical_query_key(query_spec: Dict) -> Tuple[str, str]:
+    """
+    Cache key for a QuerySpec: (source table, canonical JSON of the rest).
+    Specs that differ only in key order, filter/groupBy order, whitespace,
+    keyword case or redundant aliases map to the same key. select and
+    orderBy keep their order since it shapes the result.
+    """
+    source = str(query_spec.get("source", "")).strip().lower()
+    canonical: Dict[str, Any] = {}
+    for key, value in query_spec.items():
+        if key == "source" or value in (None, [], {}, ""):
+            continue
+        if key in ("select", "orderBy") and isinstance(value, list):
+            value = [_normalize_query_item(item) for item in value]
+        elif key == "filters" and isinstance(value, list):
+            value = sorted(
+                (_normalize_query_item(item) for item in value),
+                key=lambda item: json.dumps(item, sort_keys=True, default=str),
+            )
+        elif key == "groupBy" and isinstance(value, list):
+            value = sorted(str(item).strip() for item in value)
+        canonical[key] = value
+    return source, json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+
+
+# Identical specs submitted concurrently share one data-lakehouse job
+QUERY_FLIGHTS = SingleFlight()
+
+
+def invalidate_table_query_results(project_id: str, table_name: str) -> int:
+    """Forget a table's cached query results, and detach its in-flight queries so they do not cache stale rows."""
+    source = f"{project_id}.{table_name}".lower()
+    QUERY_FLIGHTS.forget_where(lambda key: key[0] == source)
+    return QUERY_CACHE.invalidate_where(lambda key: key[0] == source)
+
+
+# --- Parquet Result Reader ---
+def create_parquet_reader() -> Optional[ParquetResultReader]:
+    """Reader for RESULT_FETCH_MODE=parquet; None (JSON rows) when not enabled or pyarrow is missing."""
+    if RESULT_FETCH_MODE != "parquet":
+        return None
+    try:
+        return ParquetResultReader(
+            RESULT_PARQUET_URI,
+            endpoint=RESULT_S3_ENDPOINT,
+            access_key=RESULT_S3_ACCESS_KEY,
+            secret_key=RESULT_S3_SECRET_KEY,
+            region=RESULT_S3_REGION,
+        )
+    except ImportError:
+        print("RESULT_FETCH_MODE=parquet requested but 'pyarrow' is not installed (pip install pyarrow); using JSON rows")
+        return None
+
+
+PARQUET_READER = create_parquet_reader()
+_PARQUET_STATUS_PARAMS = dict(parse_qsl(RESULT_PARQUET_STATUS_PARAMS)) if PARQUET_READER is not None else {}
+if PARQUET_READER is not None and not _PARQUET_STATUS_PARAMS:
+    print("RESULT_FETCH_MODE=parquet without RESULT_PARQUET_STATUS_PARAMS: status polls still return JSON rows, which are used as-is")
+
+
+async def attach_parquet_rows(status_data: Dict, query_json: Dict, job_id: str) -> Dict:
+    """
+    Fill in the rows of a status payload that came back without them (see
+    RESULT_PARQUET_STATUS_PARAMS) from the job's Parquet result, reading only the
+    selected columns. A payload that already carries rows is returned as-is, since
+    the JSON transfer has been paid for. Raises 502 when the file cannot be read.
+    """
+    if result_rows(status_data)[0] is not None:
+        return status_data
+    project_id = str(query_json.get("source", "")).split(".", 1)[0]
+    try:
+        rows = await asyncio.to_thread(PARQUET_READER.read, project_id, job_id, projected_columns(query_json))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Reading Parquet result for job {job_id} failed: {e}")
+    return {**status_data, "resultData": rows, "rowCount": len(rows), "resultSource": "parquet"}
+
+
 # --- Data-Lakehouse Integration ---
-async def execute_query_on_datalake(query_json: Dict) -> Dict:
+async def execute_query_on_datalake(query_json: Dict, use_cache: bool = True) -> Dict:
     """Send generated query to data-lakehouse for execution and wait for completion"""
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    cache_key = canonical_query_key(query_json)
+    if use_cache:
+        cached = QUERY_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+    return await QUERY_FLIGHTS.do(cache_key, lambda: _run_scheduled_query(query_json, cache_key))
+
+
+async def _run_scheduled_query(query_json: Dict, cache_key: Tuple[str, str]) -> Dict:
+    """
+    Run a query under the scheduler's caps. The shared job holds the slots, so a
+    caller that gives up at its deadline does not free one while others still wait
+    on the query; once every caller has gone, the job is cancelled and frees them.
+    """
+    project_id = str(query_json.get("source", "")).split(".", 1)[0]
+    # Project slot first: charts queued behind their own project's cap must not hold global slots
+    async with _project_semaphore(project_id), _DATALAKE_SEMAPHORE:
+        return await _run_query_on_datalake(query_json, cache_key)
+
+
+async def submit_datalake_query(query_json: Dict) -> str:
+    """Submit a query to the data-lakehouse and return its job id. Raises httpx.HTTPError on HTTP errors."""
+    response = await get_datalake_client().post(
+        f"{DATALAKE_BASE_URL}/query",
+        json=query_json,
+        timeout=60.0,
+    )
+    response.raise_for_status()
+    result = response.json()
+
+    job_id = result.get("jobId")
+    if not job_id:
+        raise HTTPException(status_code=500, detail="No jobId returned from data-lakehouse")
+    return job_id
+
+
+async def _run_query_on_datalake(query_json: Dict, cache_key: Tuple[str, str]) -> Dict:
+    try:
+        job_id = await submit_datalake_query(query_json)
+
+        # Wait for query completion
         try:
-            # Submit query
-            response = await client.post(
-                f"{DATALAKE_BASE_URL}/query",
-                json=query_json
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            job_id = result.get("jobId")
-            if not job_id:
-                raise HTTPException(status_code=500, detail="No jobId returned from data-lakehouse")
-            
-            # Poll for query completion
-            for attempt in range(60):
-                status_response = await client.get(
-                    f"{DATALAKE_BASE_URL}/query/{job_id}"
-                )
-                status_response.raise_for_status()
-                status_data = status_response.json()
-                
-                if status_data.get("status") == "completed":
-                    print(f"Query {job_id} completed with {status_data.get('rowCount', 0)} rows")
-                    return status_data
-                elif status_data.get("status") == "failed":
-                    raise HTTPException(
-                        status_code=500, 
-                        detail=f"Query failed: {status_data.get('message', 'Unknown error')}"
-                    )
-                
-                await asyncio.sleep(1)
-            
+            status_data = await wait_for_job(job_id, timeout=60.0, params=_PARQUET_STATUS_PARAMS)
+        except asyncio.TimeoutError:
             raise HTTPException(status_code=500, detail="Query execution timeout")
-            
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Data-lakehouse error: {str(e)}")
+
+        if status_data.get("status") == "failed":
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Query failed: {status_data.get('message', 'Unknown error')}"
+            )
+        if PARQUET_READER is not None:
+            status_data = await attach_parquet_rows(status_data, query_json, job_id)
+        print(f"Query {job_id} completed with {status_data.get('rowCount', 0)} rows")
+        # Skip caching when the table was invalidated while this query ran
+        if QUERY_FLIGHTS.in_flight(cache_key) is asyncio.current_task():
+            QUERY_CACHE.set(cache_key, status_data)
+        return status_data
+        
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Data-lakehouse error: {str(e)}")
+
+
+# --- LLM Response Cache ---
+# Both LLM calls run at temperature=0, so identical (model, messages) give reusable output
+LLM_CACHE = TTLCache(maxsize=LLM_CACHE_MAXSIZE, ttl=LLM_CACHE_TTL)
+LLM_DISK_CACHE = SQLiteCache(LLM_CACHE_PATH, ttl=LLM_CACHE_DISK_TTL, max_entries=LLM_CACHE_DISK_MAX_ENTRIES) if LLM_CACHE_PATH else None
+
+
+def llm_cache_key(model: str, messages: List[Dict[str, str]], temperature: float = 0) -> str:
+    payload = json.dumps({"model": model, "messages": messages, "temperature": temperature}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def complete_chat(
+    model: str,
+    messages: List[Dict[str, str]],
+    use_cache: bool = True,
+    validate: Optional[Callable[[str], Any]] = None,
+) -> str:
+    """
+    Return the completion text for `messages`, served from the cache when possible.
+    `use_cache=False` skips the lookup but still refreshes the cache. Responses for
+    which `validate` raises are returned but not cached.
+    """
+    key = llm_cache_key(model, messages)
+    if use_cache:
+        content = LLM_CACHE.get(key)
+        if content is None and LLM_DISK_CACHE is not None:
+            content = await asyncio.to_thread(LLM_DISK_CACHE.get, key)
+            if content is not None:
+                LLM_CACHE.set(key, content)
+        if content is not None:
+            return content
+
+    response = await CLIENT.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0,
+    )
+    content = response.choices[0].message.content
+    print(f"Raw response content: {content}")
+    if not content:
+        return content
+    if validate is not None:
+        try:
+            validate(content)
+        except Exception:
+            return content
+    LLM_CACHE.set(key, content)
+    if LLM_DISK_CACHE is not None:
+        await asyncio.to_thread(LLM_DISK_CACHE.set, key, content)
+    return content
+
+
+async def stream_chat(
+    model: str,
+    messages: List[Dict[str, str]],
+    use_cache: bool = True,
+    validate: Optional[Callable[[str], Any]] = None,
+) -> AsyncIterator[str]:
+    """
+    Like complete_chat, but yields the completion text in chunks as the model
+    produces it. A cached completion is yielded as a single chunk; the full text
+    is cached once the stream ends.
+    """
+    key = llm_cache_key(model, messages)
+    if use_cache:
+        content = LLM_CACHE.get(key)
+        if content is None and LLM_DISK_CACHE is not None:
+            content = await asyncio.to_thread(LLM_DISK_CACHE.get, key)
+            if content is not None:
+                LLM_CACHE.set(key, content)
+        if content is not None:
+            yield content
+            return
+
+    stream = await CLIENT.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0,
+        stream=True,
+    )
+    parts = []
+    try:
+        async for event in stream:
+            delta = event.choices[0].delta.content if event.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        await stream.close()
+    content = "".join(parts)
+    print(f"Raw streamed content: {content}")
+    if not content:
+        return
+    if validate is not None:
+        try:
+            validate(content)
+        except Exception:
+            return
+    LLM_CACHE.set(key, content)
+    if LLM_DISK_CACHE is not None:
+        await asyncio.to_thread(LLM_DISK_CACHE.set, key, content)
+
+
+def _parse_suggestion_content(content: str) -> List[Dict]:
+    # Extract JSON from wrapper tags if present
+    if "[OUT]" in content and "[/OUT]" in content:
+        content = content.split("[OUT]")[1].split("[/OUT]")[0].strip()
+    return json.loads(content)["chosen_charts"]
+
+
+def _parse_batch_suggestion_content(content: str, count: int) -> List[List[Dict]]:
+    """Per-prompt chosen_charts from a batched answer; raises unless every index 0..count-1 is present."""
+    if "[OUT]" in content and "[/OUT]" in content:
+        content = content.split("[OUT]")[1].split("[/OUT]")[0].strip()
+    results = json.loads(content)["results"]
+    chosen: Dict[int, List[Dict]] = {}
+    for item in results:
+        index = int(item["index"])
+        if not isinstance(item["chosen_charts"], list):
+            raise ValueError(f"chosen_charts for prompt {index} is not a list")
+        chosen[index] = item["chosen_charts"]
+    if sorted(chosen) != list(range(count)):
+        raise ValueError(f"Expected results for {count} prompts, got indexes {sorted(chosen)}")
+    return [chosen[index] for index in range(count)]
+
+
+def _parse_query_builder_content(content: str) -> Dict:
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]  # Remove ```json
+    if content.startswith("```"):
+        content = content[3:]  # Remove ```
+    if content.endswith("```"):
+        content = content[:-3]  # Remove trailing ```
+    content = content.strip()
+    return json.loads(content)
 
 
 # --- Logic Classes (Adapted from prompt2.py) ---
 
 class ChartSuggester:
-    def __init__(self, charts_config: List[Dict], model: str = MODEL):
+    def __init__(
+        self,
+        catalog: ChartCatalog,
+        model: str = MODEL,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT,
+        top_k: int = CHART_RANKER_TOP_K,
+        always_include: Optional[List[str]] = None,
+        mode: str = SUGGEST_MODE,
+        batch: bool = SUGGEST_BATCH,
+        batch_token_budget: int = SUGGEST_BATCH_TOKEN_BUDGET,
+        batch_max_prompts: int = SUGGEST_BATCH_MAX_PROMPTS,
+    ):
         self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.top_k = top_k
+        include = CHART_RANKER_ALWAYS_INCLUDE if always_include is None else always_include
+        self.always_include_ids = [record.chart_id for record in catalog if record.name in include]
+        self.mode = mode
+        self.batch = batch
+        self.batch_token_budget = batch_token_budget
+        self.batch_max_prompts = batch_max_prompts
         self.minimal_config = [
             {
-                "id": chart.get("chart_id"),
-                "name": chart.get("name"),
-                "why": chart.get("why"),
-                "use_cases": chart.get("use_cases")
+                "id": record.chart_id,
+                "name": record.name,
+                "why": record.why,
+                "use_cases": record.use_cases
             }
-            for chart in charts_config
+            for record in catalog
         ]
         self.system_prompt = """
         You are a data visualization assistant.
@@ -109,61 +757,236 @@ class ChartSuggester:
         Do not include any extra text, explanation, or markdown.
         Do not make assumptions about the dataset yet.
         """
+        # Built once per catalog load and reused by every prompt
+        self.charts_config_json = json.dumps(self.minimal_config, separators=(',', ':'))
+        self.system_message = {"role": "system", "content": self.system_prompt}
+        self.batch_system_prompt = """
+        You are a data visualization assistant.
+        You are given a numbered list of user requests and a list of chart configurations (id, name, why, use_cases).
+        Your task, for EACH request independently:
+        1. Read the request carefully.
+        2. Compare it with the provided chart configurations.
+        3. Choose ALL charts relevant to that request. Do not pick just the most obvious.
+        4. If no chart is relevant, use an empty list for that request.
+        5. Return ONLY JSON, with one entry per request index, in this exact format:
+
+        {
+          "results": [
+            {"index": <request_index>, "chosen_charts": [{"id": "<chart_id>", "name": "<chart_name>"}]}
+          ]
+        }
+
+        Do not include any extra text, explanation, or markdown.
+        Do not make assumptions about the dataset yet.
+        """
+        self.batch_system_message = {"role": "system", "content": self.batch_system_prompt}
+        # Per-chart JSON fragments, joined into a top-k subset of the catalog per prompt
+        self.ranker = ChartRanker(catalog.records)
+        self._chart_json = {
+            entry["id"]: json.dumps(entry, separators=(',', ':')) for entry in self.minimal_config
+        }
 
-    async def suggest(self, user_prompts: List[str]) -> List[Dict]:
-        results = []
+    def rank_charts(self, prompt: str, top_k: int, min_score: float = CHART_RANKER_MIN_SCORE) -> List[Dict]:
+        """Locally ranked charts for `prompt` as {"id", "name", "score"}, best first."""
+        return [
+            {"id": record.chart_id, "name": record.name, "score": round(score, 4)}
+            for record, score in self.ranker.rank(prompt, top_k)
+            if score >= min_score
+        ]
 
-        for prompt in user_prompts:
-            try:
-                response = await CLIENT.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
+    def candidate_ids(self, prompt: str) -> Optional[List[Any]]:
+        """Ids of the top-k ranked charts for `prompt`, or None when the whole catalog should be sent."""
+        if self.top_k <= 0 or self.top_k >= len(self.minimal_config):
+            return None
+        candidates = self.rank_charts(prompt, self.top_k, min_score=1e-6)
+        if not candidates:
+            return None
+        ids = [chart["id"] for chart in candidates]
+        return ids + [chart_id for chart_id in self.always_include_ids if chart_id not in ids]
+
+    def candidate_config_json(self, prompt: str) -> str:
+        """Catalog sent to the LLM: the top-k ranked charts, or all of them when nothing matches."""
+        ids = self.candidate_ids(prompt)
+        if ids is None:
+            return self.charts_config_json
+        return "[" + ",".join(self._chart_json[chart_id] for chart_id in ids) + "]"
+
+    def batch_config_json(self, prompts: List[str]) -> str:
+        """Union of the prompts' candidate charts, in catalog order."""
+        wanted = set()
+        for prompt in prompts:
+            ids = self.candidate_ids(prompt)
+            if ids is None:
+                return self.charts_config_json
+            wanted.update(ids)
+        return "[" + ",".join(fragment for chart_id, fragment in self._chart_json.items() if chart_id in wanted) + "]"
+
+    def _batch_messages(self, prompts: List[str]) -> List[Dict[str, str]]:
+        numbered = json.dumps([{"index": index, "request": prompt} for index, prompt in enumerate(prompts)], ensure_ascii=False)
+        return [
+            self.batch_system_message,
+            {
+                "role": "user",
+                "content": f"User requests: {numbered}\nCharts config: {self.batch_config_json(prompts)}"
+            }
+        ]
+
+    def split_batches(self, prompts: List[str]) -> List[List[str]]:
+        """Greedily group prompts so each batched request stays within the token budget."""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        for prompt in prompts:
+            candidate = current + [prompt]
+            tokens = sum(count_tokens(message["content"]) for message in self._batch_messages(candidate))
+            if current and (len(candidate) > self.batch_max_prompts or tokens > self.batch_token_budget):
+                batches.append(current)
+                candidate = [prompt]
+            current = candidate
+        if current:
+            batches.append(current)
+        return batches
+
+    async def suggest(
+        self,
+        user_prompts: List[str],
+        use_cache: bool = True,
+        mode: Optional[str] = None,
+        batch: Optional[bool] = None,
+    ) -> List[Dict]:
+        """
+        Run one LLM call per prompt concurrently, at most `max_concurrency` in flight.
+        In batch mode prompts are packed into as few calls as the token budget allows.
+        In "local" mode charts come from the ranker alone and no LLM call is made.
+        Results keep the order of `user_prompts`.
+        """
+        if (mode or self.mode) == "local":
+            return [
+                {"user_prompt": prompt, "chosen_charts": self.rank_charts(prompt, CHART_RANKER_LOCAL_TOP_K)}
+                for prompt in user_prompts
+            ]
+
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def bounded(prompt: str) -> Dict:
+            async with semaphore:
+                return await self._suggest_one(prompt, use_cache)
+
+        if (self.batch if batch is None else batch) and len(user_prompts) > 1:
+            async def bounded_batch(prompts: List[str]) -> List[Dict]:
+                async with semaphore:
+                    results = await self._suggest_batch(prompts, use_cache)
+                if results is None:
+                    # Unusable batch answer: per-prompt calls, each taking its own slot
+                    results = list(await asyncio.gather(*(bounded(prompt) for prompt in prompts)))
+                return results
+
+            batches = await asyncio.gather(*(bounded_batch(prompts) for prompts in self.split_batches(user_prompts)))
+            return [result for results in batches for result in results]
+
+        return list(await asyncio.gather(*(bounded(prompt) for prompt in user_prompts)))
+
+    async def _suggest_batch(self, prompts: List[str], use_cache: bool = True) -> Optional[List[Dict]]:
+        """One LLM call for `prompts`; None when the answer is unusable and each prompt needs its own call."""
+        if len(prompts) == 1:
+            return [await self._suggest_one(prompts[0], use_cache)]
+        try:
+            content = await asyncio.wait_for(
+                complete_chat(
+                    self.model,
+                    self._batch_messages(prompts),
+                    use_cache=use_cache,
+                    validate=lambda text: _parse_batch_suggestion_content(text, len(prompts)),
+                ),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            print(f"Timed out after {self.timeout}s processing a batch of {len(prompts)} prompts")
+            return [{"user_prompt": prompt, "chosen_charts": []} for prompt in prompts]
+        except Exception as e:
+            print(f"Error processing a batch of {len(prompts)} prompts: {e}")
+            return [{"user_prompt": prompt, "chosen_charts": []} for prompt in prompts]
+        try:
+            chosen = _parse_batch_suggestion_content(content, len(prompts))
+        except (KeyError, TypeError, ValueError) as e:
+            # json.JSONDecodeError is a ValueError
+            print(f"Failed to parse batched JSON ({e}); falling back to per-prompt calls")
+            return None
+        return [
+            {"user_prompt": prompt, "chosen_charts": chosen_charts}
+            for prompt, chosen_charts in zip(prompts, chosen)
+        ]
+
+    async def _suggest_one(self, prompt: str, use_cache: bool = True) -> Dict:
+        try:
+            content = await asyncio.wait_for(
+                complete_chat(
+                    self.model,
+                    [
+                        self.system_message,
                         {
                             "role": "user",
-                            "content": f"User request: {prompt}\nCharts config: {json.dumps(self.minimal_config, separators=(',', ':'))}"
+                            "content": f"User request: {prompt}\nCharts config: {self.candidate_config_json(prompt)}"
                         }
                     ],
-                    temperature=0,
-                )
-                content = response.choices[0].message.content
-                print(f"Raw response content: {content}")
-                # Handle potential JSON parsing errors or wrapping
-                try:
-                    # Extract JSON from wrapper tags if present
-                    if "[OUT]" in content and "[/OUT]" in content:
-                        content = content.split("[OUT]")[1].split("[/OUT]")[0].strip()
-                    chosen_charts = json.loads(content)["chosen_charts"]
-                except (KeyError, json.JSONDecodeError) as e:
-                    # Fallback or empty if parsing failed
-                    chosen_charts = []
-                    print(f'Failed to parse JSON: {e}')
-
-                results.append({
-                    "user_prompt": prompt,
-                    "chosen_charts": chosen_charts
-                })
-            except Exception as e:
-                # Log error and return empty for this prompt
-                print(f"Error processing prompt '{prompt}': {e}")
-                results.append({
-                    "user_prompt": prompt,
-                    "chosen_charts": []
-                })
+                    use_cache=use_cache,
+                    validate=_parse_suggestion_content,
+                ),
+                timeout=self.timeout,
+            )
+            # Handle potential JSON parsing errors or wrapping
+            try:
+                chosen_charts = _parse_suggestion_content(content)
+            except (KeyError, json.JSONDecodeError) as e:
+                # Fallback or empty if parsing failed
+                chosen_charts = []
+                print(f'Failed to parse JSON: {e}')
 
-        return results
+            return {
+                "user_prompt": prompt,
+                "chosen_charts": chosen_charts
+            }
+        except asyncio.TimeoutError:
+            print(f"Timed out after {self.timeout}s processing prompt '{prompt}'")
+            return {
+                "user_prompt": prompt,
+                "chosen_charts": []
+            }
+        except Exception as e:
+            # Log error and return empty for this prompt
+            print(f"Error processing prompt '{prompt}': {e}")
+            return {
+                "user_prompt": prompt,
+                "chosen_charts": []
+            }
+
+
+def _chosen_chart_id(chosen: Any) -> Any:
+    """Chart id of a chosen_charts entry ({"id", "name"} from the suggester, or a bare id)."""
+    return chosen.get("id", chosen.get("chart_id")) if isinstance(chosen, dict) else chosen
 
 
 class ChartValidatorAndQueryBuilder:
-    def __init__(self, charts_config: List[Dict], model: str = MODEL):
+    def __init__(
+        self,
+        catalog: ChartCatalog,
+        model: str = MODEL,
+        mode: str = BUILD_MODE,
+        compaction: bool = BUILD_PROMPT_COMPACTION,
+        token_budget: int = BUILD_PROMPT_TOKEN_BUDGET,
+    ):
         self.model = model
+        self.mode = mode
+        self.compaction = compaction
+        self.token_budget = token_budget
+        self.prompt_stats = {"requests": 0, "tokens_sent": 0, "tokens_saved": 0, "columns_dropped": 0}
+        self.rules = RuleQueryBuilder(catalog.records)
         self.minimal_config = [
             {
-                "id": chart.get("chart_id"),
-                "name": chart.get("name"),
-                "data_requirements": chart.get("data_requirements", {}),
+                "id": record.chart_id,
+                "name": record.name,
+                "data_requirements": record.data_requirements,
             }
-            for chart in charts_config
+            for record in catalog
         ]
         self.system_prompt = """
         You are a data visualization assistant that outputs only JSON.
@@ -240,101 +1063,714 @@ class ChartValidatorAndQueryBuilder:
 
         
         """
+        # Built once per catalog load and reused by every request
+        self.charts_config_json = json.dumps(self.minimal_config)
+        self.system_message = {"role": "system", "content": self.system_prompt}
+        self.system_tokens = count_tokens(self.system_prompt)
+        self.charts_config_tokens = count_tokens(self.charts_config_json)
+        # Per-chart JSON fragments and their token counts, joined into the suggested subset of the catalog per request
+        self._chart_json: Dict[str, Tuple[str, int]] = {}
+        for entry in self.minimal_config:
+            fragment = json.dumps(entry, separators=(',', ':'))
+            self._chart_json[str(entry["id"])] = self._chart_json[str(entry["name"])] = (fragment, count_tokens(fragment))
+
+    def suggested_config(self, recommended_charts_with_prompts: List[Dict]) -> Tuple[str, int]:
+        """
+        Requirements of the suggested charts only, or the whole catalog if one is
+        unknown, with their token count summed from the per-chart counts.
+        """
+        fragments = {}
+        for suggestion in recommended_charts_with_prompts:
+            for chosen in suggestion.get("chosen_charts") or []:
+                fragment = self._chart_json.get(str(_chosen_chart_id(chosen)))
+                if fragment is None and isinstance(chosen, dict):
+                    fragment = self._chart_json.get(str(chosen.get("name")))
+                if fragment is None:
+                    return self.charts_config_json, self.charts_config_tokens
+                fragments[fragment[0]] = fragment[1]
+        return "[" + ",".join(fragments) + "]", sum(fragments.values())
 
-    async def build_final_charts(self, dataset_metadata: Dict, recommended_charts_with_prompts: List[Dict]) -> Dict:
+    def build_messages(self, dataset_metadata: Dict, recommended_charts_with_prompts: List[Dict]) -> Tuple[List[Dict[str, str]], Optional[Dict[str, int]]]:
+        """Query-builder messages, plus token stats when the prompt was compacted."""
+        if not self.compaction:
+            content = f"Dataset metadata: {json.dumps(dataset_metadata)}\nRecommended charts with prompts: {json.dumps(recommended_charts_with_prompts)}\nChart configurations: {self.charts_config_json}"
+            return [self.system_message, {"role": "user", "content": content}], None
+        charts_json, charts_tokens = self.suggested_config(recommended_charts_with_prompts)
+        content, stats = build_compact_content(
+            dataset_metadata,
+            recommended_charts_with_prompts,
+            charts_json,
+            self.token_budget,
+            fixed_tokens=self.system_tokens,
+        )
+        # The uncompacted prompt is estimated rather than serialized and counted:
+        # the whole catalog's count is cached, and the metadata part is scaled up
+        # by the columns that were dropped.
+        metadata_tokens = max(stats["tokens"] - charts_tokens, 0)
+        if stats["columns_sent"]:
+            metadata_tokens = metadata_tokens * stats["columns_total"] // stats["columns_sent"]
+        full_tokens = max(metadata_tokens + self.charts_config_tokens, stats["tokens"])
+        stats = {
+            "full": full_tokens + self.system_tokens,
+            "sent": stats["tokens"] + self.system_tokens,
+            "saved": full_tokens - stats["tokens"],
+            "columns_total": stats["columns_total"],
+            "columns_sent": stats["columns_sent"],
+        }
+        if self.token_budget > 0 and stats["sent"] > self.token_budget:
+            print(f"Query builder prompt is {stats['sent']} tokens, over the {self.token_budget} token budget")
+        self.prompt_stats["requests"] += 1
+        self.prompt_stats["tokens_sent"] += stats["sent"]
+        self.prompt_stats["tokens_saved"] += stats["saved"]
+        self.prompt_stats["columns_dropped"] += stats["columns_total"] - stats["columns_sent"]
+        return [self.system_message, {"role": "user", "content": content}], stats
+
+    def build_with_rules(self, dataset_metadata: Dict, recommended_charts_with_prompts: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Build the charts the rules can map unambiguously. Returns (built charts, the
+        suggestions still needing the LLM, with only their ambiguous charts).
+        """
+        columns = [(name, column_kind(data_type)) for name, data_type in schema_columns(dataset_metadata)]
+        built: List[Dict] = []
+        remaining: List[Dict] = []
+        for suggestion in recommended_charts_with_prompts:
+            prompt = str(suggestion.get("user_prompt", ""))
+            ambiguous = []
+            for chosen in suggestion.get("chosen_charts") or []:
+                outcome, chart = self.rules.build(prompt, _chosen_chart_id(chosen), columns)
+                if outcome == "built":
+                    built.append(chart)
+                elif outcome == "ambiguous":
+                    ambiguous.append(chosen)
+            if ambiguous:
+                remaining.append({**suggestion, "chosen_charts": ambiguous})
+        return built, remaining
+
+    async def _build_with_llm(self, dataset_metadata: Dict, recommended_charts_with_prompts: List[Dict], use_cache: bool) -> Dict:
+        messages, prompt_tokens = self.build_messages(dataset_metadata, recommended_charts_with_prompts)
         try:
-            response = await CLIENT.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {
-                        "role": "user",
-                        "content": f"Dataset metadata: {json.dumps(dataset_metadata)}\nRecommended charts with prompts: {json.dumps(recommended_charts_with_prompts)}\nChart configurations: {json.dumps(self.minimal_config)}"
-                    }
-                ],
-                temperature=0,
+            content = await complete_chat(
+                self.model,
+                messages,
+                use_cache=use_cache,
+                validate=_parse_query_builder_content,
             )
-            content = response.choices[0].message.content
-            print(f"Raw response content: {content}")
-            content = content.strip()
-            if content.startswith("```json"):
-                content = content[7:]  # Remove ```json
-            if content.startswith("```"):
-                content = content[3:]  # Remove ```
-            if content.endswith("```"):
-                content = content[:-3]  # Remove trailing ```
-            content = content.strip()
-            
-            return json.loads(content)
+            result = _parse_query_builder_content(content)
         except json.JSONDecodeError:
-            return {"intent": "visualization", "charts": []}
+            result = {"intent": "visualization", "charts": []}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error in Query Builder: {str(e)}")
+        if prompt_tokens is not None and isinstance(result, dict):
+            result["prompt_tokens"] = prompt_tokens
+        return result
+
+    async def build_final_charts(
+        self,
+        dataset_metadata: Dict,
+        recommended_charts_with_prompts: List[Dict],
+        use_cache: bool = True,
+        mode: Optional[str] = None,
+    ) -> Dict:
+        """
+        Validate suggested charts against the dataset and build their queries. In
+        "rules" mode common charts are built locally and the LLM is called only for
+        the rest; charts keep their suggestion order either way.
+        """
+        if (mode or self.mode) != "rules":
+            return await self._build_with_llm(dataset_metadata, recommended_charts_with_prompts, use_cache)
+        built, remaining = self.build_with_rules(dataset_metadata, recommended_charts_with_prompts)
+        result = {"intent": "visualization", "charts": built}
+        if remaining:
+            llm_result = await self._build_with_llm(dataset_metadata, remaining, use_cache)
+            result = {**llm_result, "charts": built + list(llm_result.get("charts") or [])}
+        sort_by_suggestion(result["charts"], recommended_charts_with_prompts)
+        return result
+
+    async def _stream_with_llm(
+        self, dataset_metadata: Dict, recommended_charts_with_prompts: List[Dict], use_cache: bool, meta: Dict[str, Any]
+    ) -> AsyncIterator[Dict]:
+        messages, prompt_tokens = self.build_messages(dataset_metadata, recommended_charts_with_prompts)
+        if prompt_tokens is not None:
+            meta["prompt_tokens"] = prompt_tokens
+        parser = ArrayItemParser("charts")
+        streamed: Dict[Tuple[str, str], int] = {}
+        try:
+            async for chunk in stream_chat(self.model, messages, use_cache=use_cache, validate=_parse_query_builder_content):
+                for chart in parser.feed(chunk):
+                    key = (str(chart.get("user_prompt")), str(chart.get("chart_id")))
+                    streamed[key] = streamed.get(key, 0) + 1
+                    yield chart
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error in Query Builder: {str(e)}")
+        # Reconcile with a parse of the whole answer: charts whose objects did not
+        # parse on their own (or were not recognised at all) are emitted now
+        try:
+            result = _parse_query_builder_content(parser.text)
+        except ValueError:
+            return
+        charts = [chart for chart in result.get("charts") or [] if isinstance(chart, dict)] if isinstance(result, dict) else []
+        if len(charts) <= parser.items_found:
+            return
+        for chart in charts:
+            key = (str(chart.get("user_prompt")), str(chart.get("chart_id")))
+            if streamed.get(key):
+                streamed[key] -= 1
+            else:
+                yield chart
+
+    async def iter_final_charts(
+        self,
+        dataset_metadata: Dict,
+        recommended_charts_with_prompts: List[Dict],
+        use_cache: bool = True,
+        mode: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming build_final_charts: yields rule-built charts first, then each
+        LLM-built chart as soon as its object is complete in the streamed answer.
+        `meta`, when given, receives the prompt token stats.
+        """
+        meta = meta if meta is not None else {}
+        remaining = recommended_charts_with_prompts
+        if (mode or self.mode) == "rules":
+            built, remaining = self.build_with_rules(dataset_metadata, recommended_charts_with_prompts)
+            for chart in built:
+                yield chart
+        if remaining:
+            async for chart in self._stream_with_llm(dataset_metadata, remaining, use_cache, meta):
+                yield chart
+
+
+def sort_by_suggestion(charts: List[Dict], recommended_charts_with_prompts: List[Dict]) -> None:
+    """Sort built charts in place into the order the suggestions listed them."""
+    order: Dict[Tuple[str, str], int] = {}
+    for suggestion in recommended_charts_with_prompts:
+        for chosen in suggestion.get("chosen_charts") or []:
+            order.setdefault((str(suggestion.get("user_prompt")), str(_chosen_chart_id(chosen))), len(order))
+    charts.sort(key=lambda chart: order.get((str(chart.get("user_prompt")), str(chart.get("chart_id"))), len(order)))
+
+# --- Shared Instances ---
+# Built at import and rebuilt by reload_charts_config(), so requests never re-serialize the catalog.
+# A malformed catalog fails here, at startup.
+CATALOG = load_catalog(CHARTS_CONFIG_PATH)
+SUGGESTER = ChartSuggester(CATALOG)
+QUERY_BUILDER = ChartValidatorAndQueryBuilder(CATALOG, MODEL)
+
+
+def reload_charts_config() -> int:
+    """
+    Reload the chart catalog and rebuild the shared suggester/query builder.
+    Raises CatalogError, keeping the current catalog, when the new one is malformed.
+    """
+    global CATALOG, SUGGESTER, QUERY_BUILDER
+    catalog = load_catalog(CHARTS_CONFIG_PATH)
+    SUGGESTER = ChartSuggester(catalog)
+    QUERY_BUILDER = ChartValidatorAndQueryBuilder(catalog, MODEL)
+    CATALOG = catalog
+    return len(catalog)
 
 # ...existing code...
-async def fetch_table_columns(project_id: str, table_name: str, timeout: int = 30) -> Dict[str, Any]:
+# --- Schema Cache ---
+SCHEMA_CACHE = TTLCache(maxsize=SCHEMA_CACHE_MAXSIZE, ttl=SCHEMA_CACHE_TTL)
+SCHEMA_FLIGHTS = SingleFlight()
+
+
+async def fetch_table_columns(project_id: str, table_name: str, timeout: int = 30, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Cached schema lookup returning {"columns": resultData}.
+    Concurrent misses for the same table share one data-lakehouse schema job.
+    """
+    key = (project_id, table_name)
+    if use_cache:
+        cached = SCHEMA_CACHE.get(key)
+        if cached is not None:
+            return cached
+    return await SCHEMA_FLIGHTS.do(key, lambda: _load_table_columns(project_id, table_name, timeout))
+
+
+def invalidate_table_schema(project_id: str, table_name: str) -> int:
+    """Forget the cached schema (and any in-flight lookup) for a table."""
+    key = (project_id, table_name)
+    SCHEMA_FLIGHTS.forget(key)
+    return int(SCHEMA_CACHE.pop(key))
+
+
+async def _load_table_columns(project_id: str, table_name: str, timeout: int = 30) -> Dict[str, Any]:
     """
     Fetch schema from data-lakehouse and return {"columns": resultData}.
     - Surfaces datalake error body for easier debugging.
     - Polls /query/{jobId} if the schema request is queued.
     """
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    client = get_datalake_client()
+    try:
+        resp = await client.get(f"{DATALAKE_BASE_URL}/schema/{project_id}/{table_name}", timeout=timeout)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Network error contacting data-lakehouse: {e}")
+
+    # try to parse JSON body even on non-2xx so we can show server message
+    try:
+        payload = resp.json()
+    except Exception:
+        payload = {"_raw_text": resp.text}
+
+    # Surface server errors with body
+    if resp.status_code >= 500:
+        detail = payload.get("error") or payload.get("message") or resp.text
+        raise HTTPException(status_code=502, detail=f"Data-lakehouse schema endpoint error {resp.status_code}: {detail}")
+    if resp.status_code >= 400:
+        detail = payload.get("error") or payload.get("message") or resp.text
+        raise HTTPException(status_code=400, detail=f"Data-lakehouse schema endpoint returned {resp.status_code}: {detail}")
+
+    # If the request returned a queued job, poll the job status
+    job_id = payload.get("jobId")
+    status = payload.get("status")
+    if job_id and status in ("queued", "running"):
         try:
-            resp = await client.get(f"{DATALAKE_BASE_URL}/schema/{project_id}/{table_name}")
+            status_payload = await wait_for_job(job_id, timeout=timeout, strict=False)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Timed out waiting for schema job to complete")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=502, detail=f"Schema job status endpoint error {e.response.status_code}: {e.response.text}")
         except httpx.HTTPError as e:
-            raise HTTPException(status_code=502, detail=f"Network error contacting data-lakehouse: {e}")
+            raise HTTPException(status_code=502, detail=f"Error polling schema job: {e}")
+
+        if status_payload.get("status") == "failed":
+            msg = status_payload.get("message") or status_payload.get("error") or json.dumps(status_payload)
+            raise HTTPException(status_code=400, detail=f"Schema job failed: {msg}")
+        payload = status_payload
+
+    # Normalize and return the resultData
+    result_data = payload.get("resultData") or payload.get("result_data") or []
+    columns = {"columns": result_data}
+    # Skip caching empty schemas (table may still be loading) and lookups invalidated mid-flight
+    key = (project_id, table_name)
+    if result_data and SCHEMA_FLIGHTS.in_flight(key) is asyncio.current_task():
+        SCHEMA_CACHE.set(key, columns)
+    return columns
+
+
+
+# --- Local Query Engine ---
+def create_local_engine() -> Optional[LocalQueryEngine]:
+    """Engine for LOCAL_ENGINE=true; None (everything goes to the data-lakehouse) when disabled or duckdb is missing."""
+    if not LOCAL_ENGINE_ENABLED:
+        return None
+    try:
+        return LocalQueryEngine(LOCAL_ENGINE_DIR, max_rows=LOCAL_ENGINE_MAX_ROWS, max_age=LOCAL_ENGINE_MAX_AGE)
+    except ImportError:
+        print("LOCAL_ENGINE requested but 'duckdb' is not installed (pip install duckdb pyarrow); using the data-lakehouse only")
+        return None
+
+
+def create_extract_reader() -> Optional[ParquetResultReader]:
+    """Parquet reader for extract pulls: the result reader when parquet mode is on, else a dedicated one."""
+    if LOCAL_ENGINE is None:
+        return None
+    if PARQUET_READER is not None:
+        return PARQUET_READER
+    try:
+        return ParquetResultReader(
+            RESULT_PARQUET_URI,
+            endpoint=RESULT_S3_ENDPOINT,
+            access_key=RESULT_S3_ACCESS_KEY,
+            secret_key=RESULT_S3_SECRET_KEY,
+            region=RESULT_S3_REGION,
+        )
+    except ImportError:
+        print("LOCAL_ENGINE extract pulls need 'pyarrow' (pip install pyarrow); tables will not be extracted")
+        return None
+
+
+LOCAL_ENGINE = create_local_engine()
+EXTRACT_READER = create_extract_reader()
+# Extract pulls skip JSON rows whenever the data-lakehouse can omit them
+_EXTRACT_STATUS_PARAMS = dict(parse_qsl(RESULT_PARQUET_STATUS_PARAMS))
+_EXTRACT_SEMAPHORE = asyncio.Semaphore(max(1, LOCAL_ENGINE_PULL_CONCURRENCY))
+EXTRACT_FLIGHTS = SingleFlight()
+_BACKGROUND_TASKS: set = set()
+
+
+async def refresh_table_extract(project_id: str, table_name: str) -> Dict[str, Any]:
+    """
+    Pull up to LOCAL_ENGINE_MAX_ROWS + 1 rows of a table from the data-lakehouse into
+    its local extract. The job's Parquet result is read as Arrow, so column types are
+    kept; pulls have their own deadline and concurrency cap instead of the chart
+    query scheduler's. Concurrent refreshes of one table share a single pull.
+    """
+    if not LocalQueryEngine.supports_table(project_id, table_name):
+        raise HTTPException(status_code=400, detail=f"Invalid project or table name: {project_id!r}.{table_name!r}")
+    if EXTRACT_READER is None:
+        raise HTTPException(status_code=409, detail="Extract pulls require 'pyarrow' (pip install pyarrow)")
+
+    async def pull() -> Dict[str, Any]:
+        schema = await fetch_table_columns(project_id, table_name)
+        columns = schema_column_names(schema)
+        if not columns:
+            raise HTTPException(status_code=400, detail=f"No columns found for {project_id}.{table_name}")
+        query_spec = {
+            "source": f"{project_id}.{table_name}",
+            "select": [{"column": column} for column in columns],
+            "filters": [],
+            "groupBy": [],
+            "orderBy": [],
+            "limit": LOCAL_ENGINE_MAX_ROWS + 1,
+        }
+        async with _EXTRACT_SEMAPHORE:
+            try:
+                job_id = await submit_datalake_query(query_spec)
+                status_data = await wait_for_job(job_id, timeout=LOCAL_ENGINE_PULL_TIMEOUT, params=_EXTRACT_STATUS_PARAMS)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail=f"Extract pull timed out after {LOCAL_ENGINE_PULL_TIMEOUT}s")
+            except httpx.HTTPError as e:
+                raise HTTPException(status_code=500, detail=f"Data-lakehouse error: {str(e)}")
+            if status_data.get("status") == "failed":
+                raise HTTPException(status_code=500, detail=f"Query failed: {status_data.get('message', 'Unknown error')}")
+            try:
+                table = await asyncio.to_thread(EXTRACT_READER.read_table, project_id, job_id)
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=f"Reading Parquet result for job {job_id} failed: {e}")
+        return await asyncio.to_thread(LOCAL_ENGINE.write_extract_table, project_id, table_name, table)
 
-        # try to parse JSON body even on non-2xx so we can show server message
+    async def pull_or_record_failure() -> Dict[str, Any]:
         try:
-            payload = resp.json()
-        except Exception:
-            payload = {"_raw_text": resp.text}
-
-        # Surface server errors with body
-        if resp.status_code >= 500:
-            detail = payload.get("error") or payload.get("message") or resp.text
-            raise HTTPException(status_code=502, detail=f"Data-lakehouse schema endpoint error {resp.status_code}: {detail}")
-        if resp.status_code >= 400:
-            detail = payload.get("error") or payload.get("message") or resp.text
-            raise HTTPException(status_code=400, detail=f"Data-lakehouse schema endpoint returned {resp.status_code}: {detail}")
-
-        # If the request returned a queued job, poll the job status
-        job_id = payload.get("jobId")
-        status = payload.get("status")
-        if job_id and status in ("queued", "running"):
-            for _ in range(timeout):
-                await asyncio.sleep(1)
-                try:
-                    status_resp = await client.get(f"{DATALAKE_BASE_URL}/query/{job_id}")
-                except httpx.HTTPError as e:
-                    raise HTTPException(status_code=502, detail=f"Error polling schema job: {e}")
+            return await pull()
+        except Exception as e:
+            # Recorded so background refreshes back off instead of re-pulling the table on every query
+            await asyncio.to_thread(LOCAL_ENGINE.record_failure, project_id, table_name, str(getattr(e, "detail", e)))
+            raise
 
-                try:
-                    status_payload = status_resp.json()
-                except Exception:
-                    status_payload = {"_raw_text": status_resp.text}
-
-                if status_resp.status_code >= 500:
-                    raise HTTPException(status_code=502, detail=f"Schema job status endpoint error {status_resp.status_code}: {status_resp.text}")
-                if status_payload.get("status") == "completed":
-                    payload = status_payload
-                    break
-                if status_payload.get("status") == "failed":
-                    msg = status_payload.get("message") or status_payload.get("error") or status_resp.text
-                    raise HTTPException(status_code=400, detail=f"Schema job failed: {msg}")
-            else:
-                raise HTTPException(status_code=504, detail="Timed out waiting for schema job to complete")
+    return await EXTRACT_FLIGHTS.do((project_id, table_name), pull_or_record_failure)
+
+
+def schedule_extract_refresh(project_id: str, table_name: str) -> None:
+    """Refresh a table's extract in the background; the current query still goes to the data-lakehouse."""
+    if EXTRACT_FLIGHTS.in_flight((project_id, table_name)) is not None:
+        return
+
+    async def refresh() -> None:
+        try:
+            info = await refresh_table_extract(project_id, table_name)
+            print(f"Extract for {project_id}.{table_name} refreshed: {info}")
+        except Exception as e:
+            print(f"Extract refresh for {project_id}.{table_name} failed: {getattr(e, 'detail', e)}")
+
+    task = asyncio.ensure_future(refresh())
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
+async def execute_query_locally(query_spec: Dict, source: str) -> Optional[Dict]:
+    """
+    Route a query to the local engine when its table has a fresh, small enough extract.
+    Returns None when the query should go to the data-lakehouse instead.
+    """
+    if LOCAL_ENGINE is None or "." not in source:
+        return None
+    project_id, table_name = source.split(".", 1)
+    if not LOCAL_ENGINE.supports_table(project_id, table_name):
+        return None
+    if not LOCAL_ENGINE.can_serve(project_id, table_name):
+        if LOCAL_ENGINE_AUTO_EXTRACT and EXTRACT_READER is not None and LOCAL_ENGINE.needs_refresh(project_id, table_name):
+            schedule_extract_refresh(project_id, table_name)
+        return None
+    try:
+        return await asyncio.to_thread(LOCAL_ENGINE.execute, query_spec, project_id, table_name)
+    except Exception as e:
+        print(f"Local execution failed for {source} ({e}); falling back to the data-lakehouse")
+        return None
+
+
+# --- Chart Query Scheduler ---
+_DATALAKE_SEMAPHORE = asyncio.Semaphore(max(1, DATALAKE_MAX_CONCURRENCY))
+_PROJECT_SEMAPHORES: Dict[str, asyncio.Semaphore] = {}
+
+
+def _project_semaphore(project_id: str) -> asyncio.Semaphore:
+    semaphore = _PROJECT_SEMAPHORES.get(project_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, DATALAKE_PROJECT_MAX_CONCURRENCY))
+        _PROJECT_SEMAPHORES[project_id] = semaphore
+    return semaphore
+
+
+def chart_max_rows(chart: Dict) -> int:
+    """Row cap from the catalog entry for the chart's type (or id), else CHART_DEFAULT_MAX_ROWS."""
+    record = CATALOG.by_name(chart.get("chart_type")) or CATALOG.by_id(chart.get("chart_id"))
+    return (record.max_rows if record is not None else None) or CHART_DEFAULT_MAX_ROWS
+
+
+def apply_row_limit(chart: Dict, query_spec: Dict) -> None:
+    """
+    For charts that are only ever truncated, ask the data-lakehouse for one row past
+    the cap so oversized results are cut at the source and still detected.
+    """
+    if downsample_strategy(str(chart.get("chart_type"))) != "truncate":
+        return
+    max_rows = chart_max_rows(chart)
+    limit = query_spec.get("limit")
+    if not isinstance(limit, int) or limit > max_rows:
+        query_spec["limit"] = max_rows + 1
+
+
+def shape_chart_data(chart: Dict, execution_result: Dict) -> Dict:
+    """
+    Return the result payload with its rows brought within the chart's row cap and
+    record what was done in chart["data_reduction"] (None when rows were untouched).
+    The cached payload is never modified.
+    """
+    key, rows = result_rows(execution_result)
+    max_rows = chart_max_rows(chart)
+    reduced, strategy = reduce_rows(
+        rows, str(chart.get("chart_type")), chart.get("encoding") or {}, max_rows, chart.get("query")
+    )
+    if strategy is None:
+        chart["data_reduction"] = None
+        return execution_result
+    chart["data_reduction"] = {
+        "strategy": strategy,
+        "max_rows": max_rows,
+        "original_rows": len(rows),
+        "returned_rows": len(reduced),
+    }
+    return {**execution_result, key: reduced}
+
+
+async def run_query(query_spec: Dict, source: str, use_cache: bool = True) -> Dict:
+    """Run a QuerySpec on the local engine when it can serve the table, else on the data-lakehouse."""
+    local_result = await execute_query_locally(query_spec, source)
+    if local_result is not None:
+        return local_result
+    return await execute_query_on_datalake(query_spec, use_cache=use_cache)
+
+
+def _query_error(label: str, error: Exception, deadline: float) -> str:
+    """Chart `error` message for a failed query, logged under `label`."""
+    if isinstance(error, asyncio.TimeoutError):
+        print(f"Deadline of {deadline}s exceeded for {label}")
+        return f"Query deadline of {deadline}s exceeded"
+    if isinstance(error, HTTPException):
+        print(f"HTTPException during execution for {label}: {error.detail}")
+        return str(error.detail)
+    print(f"General exception during execution for {label}: {str(error)}")
+    return f"Execution error: {str(error)}"
+
+
+QUERY_VALIDATION_STATS = {"valid": 0, "repaired": 0, "rejected": 0}
+
+
+def validate_chart_queries(charts: List[Dict], dataset_metadata: Dict[str, Any]) -> List[Dict]:
+    """
+    Check each chart's LLM-built query against the QuerySpec model and the table's
+    columns before submission, fixing common shape errors in place. The outcome is
+    recorded as chart["query_validation"]; rejected charts get `error` and are not run.
+    """
+    columns = schema_column_names(dataset_metadata)
+    for chart in charts:
+        try:
+            query, repairs = validate_query(chart.get("query"), columns)
+        except QueryValidationError as e:
+            QUERY_VALIDATION_STATS["rejected"] += 1
+            chart["query_validation"] = {"status": "rejected", "repairs": [], "errors": e.errors}
+            chart["error"] = f"Invalid query for chart {chart.get('chart_id')}: {e}"
+            continue
+        status = "repaired" if repairs else "valid"
+        QUERY_VALIDATION_STATS[status] += 1
+        chart["query"] = query
+        chart["query_validation"] = {"status": status, "repairs": repairs, "errors": []}
+    return charts
+
+
+def _is_rejected(chart: Dict) -> bool:
+    return (chart.get("query_validation") or {}).get("status") == "rejected"
+
+
+async def execute_chart_query(chart: Dict, source: str, deadline: float = CHART_QUERY_DEADLINE, use_cache: bool = True) -> Dict:
+    """
+    Run one chart's query on the data-lakehouse and store the outcome on the chart
+    as `data` / `error`, with rows reduced to the chart's cap (see shape_chart_data).
+    The deadline covers both waiting for a slot and execution.
+    """
+    try:
+        # Convert to QuerySpec format
+        query_spec = chart["query"]
+        query_spec["source"] = source
+        apply_row_limit(chart, query_spec)
+        print(f"Executing query for chart {chart['chart_id']}: {query_spec}")
+        execution_result = await asyncio.wait_for(run_query(query_spec, source, use_cache), timeout=deadline)
+        print(f"Execution result for chart {chart['chart_id']}: {execution_result}")
+        chart["data"] = shape_chart_data(chart, execution_result)
+        chart["error"] = None
+    except Exception as e:
+        chart["error"] = _query_error(f"chart {chart.get('chart_id')}", e, deadline)
+    return chart
+
+
+async def execute_fused_charts(fused: FusedQuery, source: str, deadline: float = CHART_QUERY_DEADLINE, use_cache: bool = True) -> List[Dict]:
+    """
+    Run one fused query for several charts, then rebuild each chart's rows from it.
+    A failure is reported on every chart in the group.
+    """
+    chart_ids = [chart.get("chart_id") for chart in fused.charts]
+    try:
+        print(f"Executing fused query for charts {chart_ids}: {fused.query}")
+        execution_result = await asyncio.wait_for(run_query(fused.query, source, use_cache), timeout=deadline)
+    except Exception as e:
+        error = _query_error(f"fused charts {chart_ids}", e, deadline)
+        for chart in fused.charts:
+            chart["error"] = error
+        return fused.charts
+    _, fused_rows = result_rows(execution_result)
+    for projection in fused.projections:
+        rows = project_rows(fused_rows, projection)
+        payload = {**execution_result, "resultData": rows, "rowCount": len(rows), "fusedWith": chart_ids}
+        projection.chart["data"] = shape_chart_data(projection.chart, payload)
+        projection.chart["error"] = None
+    return fused.charts
+
+
+def plan_chart_queries(charts: List[Dict], source: str) -> Tuple[List[FusedQuery], List[Dict], List[Dict]]:
+    """
+    (fused groups, charts run alone, charts rejected by validate_chart_queries).
+    Row caps are applied before planning, so a capped chart has a limit and never
+    leads an unlimited fused query.
+    """
+    rejected = [chart for chart in charts if _is_rejected(chart)]
+    charts = [chart for chart in charts if not _is_rejected(chart)]
+    if not QUERY_FUSION:
+        return [], charts, rejected
+    for chart in charts:
+        if isinstance(chart.get("query"), dict):
+            chart["query"]["source"] = source
+            apply_row_limit(chart, chart["query"])
+    fused, single = plan_fusion(charts, max_group_columns=QUERY_FUSION_MAX_GROUP_COLUMNS)
+    return fused, single, rejected
+
+
+def _chart_query_groups(charts: List[Dict], source: str, use_cache: bool = True) -> List[Awaitable[List[Dict]]]:
+    """
+    One awaitable per query to run: fused groups of charts, or a single chart each.
+    Charts rejected by validate_chart_queries complete immediately with their error.
+    """
+    fused, single, rejected = plan_chart_queries(charts, source)
+
+    async def one(chart: Dict) -> List[Dict]:
+        return [await execute_chart_query(chart, source, use_cache=use_cache)]
+
+    async def skipped(chart: Dict) -> List[Dict]:
+        return [chart]
+
+    return (
+        [execute_fused_charts(group, source, use_cache=use_cache) for group in fused]
+        + [one(chart) for chart in single]
+        + [skipped(chart) for chart in rejected]
+    )
+
+
+async def timed_stage(timings: Dict[str, float], name: str, awaitable: Awaitable[Any]) -> Any:
+    """Await one pipeline stage and record its wall time in milliseconds under `name`."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def run_chart_queries(charts: List[Dict], source: str, use_cache: bool = True) -> List[Dict]:
+    """Submit all chart queries concurrently; total latency tracks the slowest chart."""
+    await asyncio.gather(*_chart_query_groups(charts, source, use_cache))
+    return charts
 
-        # Normalize and return the resultData
-        result_data = payload.get("resultData") or payload.get("result_data") or []
-        return {"columns": result_data}
 
+async def iter_chart_queries(charts: List[Dict], source: str, use_cache: bool = True) -> AsyncIterator[Dict]:
+    """
+    Submit all chart queries concurrently and yield each chart as soon as its query
+    finishes. Queries still running when the consumer stops are cancelled.
+    """
+    tasks = [asyncio.ensure_future(group) for group in _chart_query_groups(charts, source, use_cache)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for chart in await next_done:
+                yield chart
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_streamed_build(
+    dataset_metadata: Dict,
+    suggestions: List[Dict],
+    source: str,
+    use_cache: bool = True,
+    build_mode: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    progress: Optional[Dict[str, Any]] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Build charts with QUERY_BUILDER.iter_final_charts and submit each chart's query
+    the moment it is built and validated, so data-lakehouse execution overlaps LLM
+    generation (charts are not fused in this mode). Yields ("query", chart) per built
+    chart and ("chart", chart) as each query finishes, keeping `progress` and the
+    "build"/"execute" `timings` up to date: build and execution overlap, so "build"
+    ends with the last built chart and "execute" with the last query. Queries still
+    running when the consumer stops are cancelled.
+    """
+    progress = progress if progress is not None else {}
+    timings = timings if timings is not None else {}
+    progress.update(charts_total=0, charts_done=0, charts=[])
+    started = time.perf_counter()
+    builder = QUERY_BUILDER.iter_final_charts(dataset_metadata, suggestions, use_cache=use_cache, mode=build_mode, meta=meta)
+
+    async def run(chart: Dict) -> Dict:
+        if _is_rejected(chart):
+            return chart
+        return await execute_chart_query(chart, source, use_cache=use_cache)
+
+    next_chart: Optional[asyncio.Future] = asyncio.ensure_future(builder.__anext__())
+    # Running query tasks, mapped to their chart's position in progress["charts"]
+    running: Dict[asyncio.Future, int] = {}
+    try:
+        while next_chart is not None or running:
+            waiting = set(running) | {next_chart} if next_chart is not None else set(running)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if next_chart in done:
+                try:
+                    chart = next_chart.result()
+                except StopAsyncIteration:
+                    next_chart = None
+                    timings["build"] = round((time.perf_counter() - started) * 1000, 1)
+                    progress["stage"] = "execute"
+                else:
+                    next_chart = asyncio.ensure_future(builder.__anext__())
+                    validate_chart_queries([chart], dataset_metadata)
+                    progress["charts_total"] += 1
+                    progress["charts"].append(_chart_progress(chart, "running"))
+                    yield "query", chart
+                    running[asyncio.ensure_future(run(chart))] = len(progress["charts"]) - 1
+            for task in done & running.keys():
+                position = running.pop(task)
+                chart = task.result()
+                progress["charts_done"] += 1
+                progress["charts"][position]["status"] = "failed" if chart.get("error") else "completed"
+                yield "chart", chart
+        timings["execute"] = round((time.perf_counter() - started) * 1000, 1)
+    finally:
+        for task in running:
+            task.cancel()
+        if next_chart is not None:
+            next_chart.cancel()
+            await asyncio.gather(next_chart, return_exceptions=True)
+        await builder.aclose()
 
 
 # --- Pydantic Models ---
 
 class SuggestChartsRequest(BaseModel):
     user_prompts: List[str]
+    bypass_cache: bool = False
+    mode: Optional[Literal["llm", "local"]] = None
+    batch: Optional[bool] = None
 
 class SuggestChartsResponse(BaseModel):
     suggestions: List[Dict[str, Any]]
@@ -342,23 +1778,81 @@ class SuggestChartsResponse(BaseModel):
 class BuildQueriesRequest(BaseModel):
     dataset_metadata: Dict[str, Any]
     suggestions: List[Dict[str, Any]]
+    bypass_cache: bool = False
+    build_mode: Optional[Literal["rules", "llm"]] = None
+    llm_stream: Optional[bool] = None
 
 class BuildQueriesResponse(BaseModel):
     intent: str
     charts: List[Dict[str, Any]]
+    prompt_tokens: Optional[Dict[str, int]] = None
 class ExecutePromptRequest(BaseModel):
     user_prompts: List[str]
     project_id: str
     table_name: str
+    bypass_cache: bool = False
+    mode: Optional[Literal["llm", "local"]] = None
+    batch: Optional[bool] = None
+    build_mode: Optional[Literal["rules", "llm"]] = None
+    llm_stream: Optional[bool] = None
 class ExecutePromptResponse(BaseModel):
     intent: str
     charts: List[Dict[str, Any]]
+    timings: Dict[str, float] = {}
+    prompt_tokens: Optional[Dict[str, int]] = None
+# --- Response Encoding ---
+
+def negotiate_chart_response(http_request: Request, format_param: Optional[str]) -> Tuple[str, Optional[str]]:
+    """(data format, content encoding) for a chart response; raises 400 on an unknown format."""
+    try:
+        data_format = negotiate_format(format_param, http_request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data_format == "arrow" and not arrow_available():
+        # Checked up front so the pipeline is not run for a response that cannot be encoded
+        raise HTTPException(status_code=406, detail="Arrow output requires 'pyarrow' (pip install pyarrow)")
+    return data_format, negotiate_encoding(http_request.headers.get("accept-encoding", ""))
+
+
+def response_fields(result: Dict, response_model: Type[BaseModel]) -> Dict:
+    """
+    `result` cut down to the response model's top-level fields, with defaults for
+    missing ones, as FastAPI's response_model filtering would return it.
+    """
+    return {
+        name: result[name] if name in result else field.get_default(call_default_factory=True)
+        for name, field in response_model.model_fields.items()
+    }
+
+
+def chart_response(
+    result: Dict, data_format: str, content_encoding: Optional[str], response_model: Type[BaseModel]
+) -> Union[Dict, Response]:
+    """
+    Encode a chart result in the negotiated format. With FAST_JSON_RESPONSES off,
+    the default (row JSON, uncompressed) is returned as-is for FastAPI to validate
+    against response_model and serialize. Encoded responses bypass that step, so
+    they are filtered to `response_model`'s fields here.
+    """
+    if data_format == "rows" and content_encoding is None and not FAST_JSON_RESPONSES:
+        return result
+    try:
+        payload = encode_chart_data(response_fields(result, response_model), data_format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    body, content_encoding = encode_body(payload, content_encoding, RESPONSE_COMPRESS_MIN_BYTES)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # --- API Endpoints ---
 
 @app.get("/charts-config", summary="Get Full Chart Configuration")
 async def get_charts_config():
     """Returns the complete charts_config JSON object."""
-    return charts_config
+    return CATALOG.charts
 
 @app.post("/suggest-charts", response_model=SuggestChartsResponse, summary="Suggest Charts from Prompts")
 async def api_suggest_charts(request: SuggestChartsRequest):
@@ -366,8 +1860,7 @@ async def api_suggest_charts(request: SuggestChartsRequest):
     Takes a list of natural language prompts and returns suggested chart types 
     relevant to each request using 'Model 1' logic.
     """
-    suggester = ChartSuggester(charts_config)
-    results = await suggester.suggest(request.user_prompts)
+    results = await SUGGESTER.suggest(request.user_prompts, use_cache=not request.bypass_cache, mode=request.mode, batch=request.batch)
     return {"suggestions": results}
 
 # @app.post("/build-queries", response_model=BuildQueriesResponse, summary="Validate & Build Chart Queries")
@@ -380,9 +1873,14 @@ async def api_suggest_charts(request: SuggestChartsRequest):
 #     final_result = await builder.build_final_charts(request.dataset_metadata, request.suggestions)
 #     return final_result
 @app.post("/build-queries", response_model=BuildQueriesResponse, summary="Build & Execute Chart Queries")
-async def api_build_queries(request: BuildQueriesRequest):
+async def api_build_queries(
+    request: BuildQueriesRequest,
+    http_request: Request,
+    format_param: Optional[str] = Query(None, alias="format", description="rows (default), columnar or arrow"),
+):
     """Build queries and execute on data-lakehouse"""
-    validator = ChartValidatorAndQueryBuilder(charts_config, MODEL)
+    data_format, content_encoding = negotiate_chart_response(http_request, format_param)
+    validator = QUERY_BUILDER
     
     # Build queries from suggestions
     # charts_with_prompts = [
@@ -390,7 +1888,16 @@ async def api_build_queries(request: BuildQueriesRequest):
     #     for s in request.suggestions
     # ]
     
-    result = await validator.build_final_charts(request.dataset_metadata, request.suggestions)
+    if _use_llm_streaming(request):
+        result = await run_streamed_build(
+            request.dataset_metadata, request.suggestions, "elm4r7a.sales", not request.bypass_cache, request.build_mode
+        )
+        return chart_response(result, data_format, content_encoding, BuildQueriesResponse)
+
+    result = await validator.build_final_charts(
+        request.dataset_metadata, request.suggestions, use_cache=not request.bypass_cache, mode=request.build_mode
+    )
+    validate_chart_queries(result.get("charts", []), request.dataset_metadata)
     
     # Execute each query on data-lakehouse
     # final_charts = []
@@ -407,81 +1914,244 @@ async def api_build_queries(request: BuildQueriesRequest):
     # # Replace source placeholder with actual source
     # source_name = f"{project_id}.{table_name}"
     
-    for chart in result.get("charts", []):
-        try:
-            # Convert to QuerySpec format
-            query_spec = chart["query"]
-            query_spec["source"] = "elm4r7a.sales"
-            print(f"Executing query for chart {chart['chart_id']}: {query_spec}")
-            execution_result = await execute_query_on_datalake(query_spec)
-            print(f"Execution result for chart {chart['chart_id']}: {execution_result}")
-            chart["data"] = execution_result
-            chart["error"] = None
-        except HTTPException as e:
-            print(f"HTTPException during execution for chart {chart['chart_id']}: {e.detail}")
-            chart["error"] = str(e.detail)
-        except Exception as e:
-            print(f"General exception during execution for chart {chart['chart_id']}: {str(e)}")
-            chart["error"] = f"Execution error: {str(e)}"
-        
-        # final_charts.append(ChartWithQuery(**chart))
+    await run_chart_queries(result.get("charts", []), "elm4r7a.sales", use_cache=not request.bypass_cache)
     
     # return BuildQueriesResponse(intent="visualization", charts=final_charts)
+    return chart_response(result, data_format, content_encoding, BuildQueriesResponse)
+
+def _use_llm_streaming(request: Union["ExecutePromptRequest", "BuildQueriesRequest"]) -> bool:
+    return LLM_STREAMING if request.llm_stream is None else request.llm_stream
+
+
+def _chart_progress(chart: Dict, status: str) -> Dict[str, Any]:
+    """Progress entry for one chart; entries are listed in chart order, since two prompts may pick the same chart."""
+    return {"user_prompt": chart.get("user_prompt"), "chart_id": chart.get("chart_id"), "status": status}
+
+
+async def run_streamed_build(
+    dataset_metadata: Dict,
+    suggestions: List[Dict],
+    source: str,
+    use_cache: bool = True,
+    build_mode: Optional[str] = None,
+) -> Dict:
+    """Run iter_streamed_build to completion and return a build_final_charts-shaped result with every chart executed."""
+    meta: Dict[str, Any] = {}
+    charts = [chart async for event, chart in iter_streamed_build(dataset_metadata, suggestions, source, use_cache, build_mode, meta) if event == "query"]
+    sort_by_suggestion(charts, suggestions)
+    result: Dict[str, Any] = {"intent": "visualization", "charts": charts}
+    if meta.get("prompt_tokens") is not None:
+        result["prompt_tokens"] = meta["prompt_tokens"]
     return result
 
+
+async def iter_prompt_pipeline(request: ExecutePromptRequest, progress: Optional[Dict[str, Any]] = None) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Suggest charts from prompts, build their queries and execute them on the data-lakehouse,
+    yielding (event, fields) as the pipeline goes: "suggestions", then "queries" with the
+    built charts (or, with LLM streaming, one "query" per chart as it is built), one "chart"
+    per chart as its query completes, and finally "done" with the whole result.
+    The schema lookup runs alongside the suggestion call; per-stage timings are in the
+    result's `timings`. `progress`, when given, is updated in place with the current stage
+    and per-chart status.
+    """
+    progress = progress if progress is not None else {}
+    use_cache = not request.bypass_cache
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    progress["stage"] = "suggest"
+    schema_task = asyncio.ensure_future(
+        timed_stage(timings, "schema", fetch_table_columns(request.project_id, request.table_name, use_cache=use_cache))
+    )
+    try:
+        suggestions = await timed_stage(
+            timings, "suggest", SUGGESTER.suggest(request.user_prompts, use_cache=use_cache, mode=request.mode, batch=request.batch)
+        )
+        yield "suggestions", {"suggestions": suggestions}
+        progress["stage"] = "schema"
+        dataset_metadata = await schema_task
+    finally:
+        schema_task.cancel()
+
+    progress["stage"] = "build"
+    source = f"{request.project_id}.{request.table_name}"
+    if _use_llm_streaming(request):
+        meta: Dict[str, Any] = {}
+        charts: List[Dict] = []
+        async for event, chart in iter_streamed_build(dataset_metadata, suggestions, source, use_cache, request.build_mode, meta, progress, timings):
+            if event == "query":
+                charts.append(chart)
+            yield event, {"chart": chart}
+        sort_by_suggestion(charts, suggestions)
+        result: Dict[str, Any] = {"intent": "visualization", "charts": charts}
+        if meta.get("prompt_tokens") is not None:
+            result["prompt_tokens"] = meta["prompt_tokens"]
+    else:
+        result = await timed_stage(timings, "build", QUERY_BUILDER.build_final_charts(dataset_metadata, suggestions, use_cache=use_cache, mode=request.build_mode))
+        charts = result.get("charts", [])
+        progress["stage"] = "validate"
+        validate_started = time.perf_counter()
+        validate_chart_queries(charts, dataset_metadata)
+        timings["validate"] = round((time.perf_counter() - validate_started) * 1000, 1)
+        yield "queries", {"intent": result.get("intent", "visualization"), "charts": charts}
+
+        progress["stage"] = "execute"
+        progress["charts_total"] = len(charts)
+        progress["charts_done"] = 0
+        progress["charts"] = [_chart_progress(chart, "running") for chart in charts]
+        positions = {id(chart): index for index, chart in enumerate(charts)}
+        execute_started = time.perf_counter()
+        async for chart in iter_chart_queries(charts, source, use_cache=use_cache):
+            progress["charts_done"] += 1
+            progress["charts"][positions[id(chart)]]["status"] = "failed" if chart.get("error") else "completed"
+            yield "chart", {"chart": chart}
+        timings["execute"] = round((time.perf_counter() - execute_started) * 1000, 1)
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    progress["stage"] = "done"
+    result["timings"] = timings
+    yield "done", result
+
+
+async def run_prompt_pipeline(request: ExecutePromptRequest, progress: Optional[Dict[str, Any]] = None) -> Dict:
+    """Run iter_prompt_pipeline to completion and return its result."""
+    result: Dict[str, Any] = {}
+    async for event, fields in iter_prompt_pipeline(request, progress):
+        if event == "done":
+            result = fields
+    return result
+
+
 @app.post("/execute-prompt", response_model=ExecutePromptResponse, summary=" Execute Chart of Prompt")
-async def api_build_queries(request: ExecutePromptRequest):
-    """Suggest charts from prompts"""
-    suggester = ChartSuggester(charts_config)
-    suggestions = await suggester.suggest(request.user_prompts)
-    dataset_metadata=await fetch_table_columns(request.project_id, request.table_name)
-    """Build queries and execute on data-lakehouse"""
-    validator = ChartValidatorAndQueryBuilder(charts_config, MODEL)
-    
-    # Build queries from suggestions
-    # charts_with_prompts = [
-    #     {"chart_id": s.chart_id, "chart_name": s.chart_name, "user_prompt": f"Visualize using {s.chart_name}"}
-    #     for s in request.suggestions
-    # ]
-    
-    result = await validator.build_final_charts(dataset_metadata, suggestions)
-    
-    # Execute each query on data-lakehouse
-    # final_charts = []
-    # Get projectId and tableName from dataset_metadata
-    # project_id = request.dataset_metadata.get("projectId")
-    # table_name = request.dataset_metadata.get("tableName")
-    
-    # if not project_id or not table_name:
-    #     raise HTTPException(
-    #         status_code=400, 
-    #         detail="dataset_metadata must include 'projectId' and 'tableName'"
-    #     )
-    
-    # # Replace source placeholder with actual source
-    # source_name = f"{project_id}.{table_name}"
-    
-    for chart in result.get("charts", []):
+async def api_build_queries(
+    request: ExecutePromptRequest,
+    http_request: Request,
+    format_param: Optional[str] = Query(None, alias="format", description="rows (default), columnar or arrow"),
+):
+    """
+    Suggest charts from prompts, build queries and execute them on the data-lakehouse.
+    Chart data is row JSON unless `?format=` or the Accept header asks for columnar
+    or Arrow; gzip/br compression follows Accept-Encoding.
+    """
+    data_format, content_encoding = negotiate_chart_response(http_request, format_param)
+    return chart_response(await run_prompt_pipeline(request), data_format, content_encoding, ExecutePromptResponse)
+
+def _ndjson(event: str, **fields: Any) -> bytes:
+    return serialize({"event": event, **fields}) + b"\n"
+
+
+@app.post("/execute-prompt/stream", summary="Execute Chart of Prompt, streamed as NDJSON")
+async def api_execute_prompt_stream(request: ExecutePromptRequest):
+    """
+    Same pipeline as /execute-prompt, streamed as newline-delimited JSON events:
+    "suggestions", then "queries" (charts without data), then one "chart" per
+    chart as its query completes, then "done" with stage timings. With LLM
+    streaming, "queries" is replaced by one "query" event per chart as it is
+    built. Failures end the stream with "error".
+    """
+    async def events() -> AsyncIterator[bytes]:
+        pipeline = iter_prompt_pipeline(request)
         try:
-            # Convert to QuerySpec format
-            query_spec = chart["query"]
-            query_spec["source"] = f"{request.project_id}.{request.table_name}"
-            print(f"Executing query for chart {chart['chart_id']}: {query_spec}")
-            execution_result = await execute_query_on_datalake(query_spec)
-            print(f"Execution result for chart {chart['chart_id']}: {execution_result}")
-            chart["data"] = execution_result
-            chart["error"] = None
+            async for event, fields in pipeline:
+                if event == "done":
+                    fields = {"charts": len(fields["charts"]), "timings": fields["timings"], "prompt_tokens": fields.get("prompt_tokens")}
+                yield _ndjson(event, **fields)
         except HTTPException as e:
-            print(f"HTTPException during execution for chart {chart['chart_id']}: {e.detail}")
-            chart["error"] = str(e.detail)
+            yield _ndjson("error", status_code=e.status_code, detail=e.detail)
         except Exception as e:
-            print(f"General exception during execution for chart {chart['chart_id']}: {str(e)}")
-            chart["error"] = f"Execution error: {str(e)}"
-        
-        # final_charts.append(ChartWithQuery(**chart))
-    
-    # return BuildQueriesResponse(intent="visualization", charts=final_charts)
-    return result
+            # Anything else would otherwise end the stream without telling the client why
+            yield _ndjson("error", status_code=500, detail=f"{type(e).__name__}: {e}")
+        finally:
+            await pipeline.aclose()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202, summary="Submit an Execute Prompt job")
+async def api_submit_job(request: ExecutePromptRequest, response: Response):
+    """
+    Queue the /execute-prompt pipeline on a background worker and return its job id.
+    Returns 429 when the job queue is full.
+    """
+    async def run(job: Job) -> Dict:
+        return await run_prompt_pipeline(request, job.progress)
+
+    try:
+        job = JOBS.submit(run)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}", summary="Get job status, progress and result")
+async def api_get_job(job_id: str):
+    """Status is queued, running, completed, failed or cancelled; `result` is set once completed."""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return Response(content=serialize(job.to_dict()), media_type="application/json")
+
+@app.delete("/jobs/{job_id}", summary="Cancel a job")
+async def api_cancel_job(job_id: str):
+    """
+    Cancel a queued or running job, including its in-flight chart queries.
+    A running job reports "cancelled" once its worker has stopped it.
+    """
+    job = JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
+
+@app.post("/admin/reload-charts-config", summary="Reload chart catalog")
+async def api_reload_charts_config():
+    """Re-read the chart catalog and rebuild the prebuilt prompt payloads; 400 if it is malformed."""
+    try:
+        return {"charts": reload_charts_config()}
+    except CatalogError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/extracts/{project_id}/{table_name}", summary="Refresh a table's local extract")
+async def api_refresh_extract(project_id: str, table_name: str):
+    """Pull a table into the local query engine now instead of waiting for the first stale query."""
+    if LOCAL_ENGINE is None:
+        raise HTTPException(status_code=409, detail="Local query engine is disabled (set LOCAL_ENGINE=true)")
+    info = await refresh_table_extract(project_id, table_name)
+    return {"project_id": project_id, "table_name": table_name, "extract": info}
+
+@app.get("/metrics", summary="Service metrics")
+async def api_metrics():
+    """Connection-pool utilization and cache hit/miss counters."""
+    return {
+        "datalake_pool": datalake_pool_stats(),
+        "parquet_results": PARQUET_READER.stats() if PARQUET_READER is not None else None,
+        "local_engine": LOCAL_ENGINE.stats() if LOCAL_ENGINE is not None else None,
+        "jobs": JOBS.stats(),
+        "query_validation": dict(QUERY_VALIDATION_STATS),
+        "query_rules": QUERY_BUILDER.rules.stats(),
+        "build_prompt": dict(QUERY_BUILDER.prompt_stats),
+        "schema_cache": SCHEMA_CACHE.stats(),
+        "query_cache": QUERY_CACHE.stats(),
+        "singleflight": {
+            "query": QUERY_FLIGHTS.stats(),
+            "schema": SCHEMA_FLIGHTS.stats(),
+        },
+        "llm_cache": {
+            "memory": LLM_CACHE.stats(),
+            "disk": LLM_DISK_CACHE.stats() if LLM_DISK_CACHE is not None else None,
+        },
+    }
+
+@app.delete("/admin/cache/{project_id}/{table_name}", summary="Invalidate cached data for a table")
+async def api_invalidate_table_cache(project_id: str, table_name: str):
+    """Call after uploading to a table so the next request sees its new schema and data."""
+    return {
+        "project_id": project_id,
+        "table_name": table_name,
+        "invalidated": {
+            "schema": invalidate_table_schema(project_id, table_name),
+            "query_results": invalidate_table_query_results(project_id, table_name),
+            "extract": LOCAL_ENGINE.drop_extract(project_id, table_name) if LOCAL_ENGINE is not None else False,
+        },
+    }
 
 @app.get("/schema/{project_id}/{table_name}/columns", summary="Get table columns as {'columns': resultData}")
 async def api_get_table_columns(project_id: str, table_name: str):
@@ -0,0 +1,90 @@
+# parquet_results.py
+
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+
+class ParquetResultReader:
+    """
+    Reads a finished query's `data.parquet` straight from object storage (S3 /
+    MinIO) or a local directory, instead of pulling rows back as JSON.
+    `uri_template` is formatted with project_id and job_id, e.g.
+    "s3://warehouse/wh/{project_id}/queries/{job_id}/data.parquet" or
+    "/data/warehouse/wh/{project_id}/queries/{job_id}/data.parquet".
+    Blocking; call from a worker thread in async code. Requires pyarrow.
+    """
+
+    def __init__(
+        self,
+        uri_template: str,
+        endpoint: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+    ):
+        import pyarrow.fs as pafs
+
+        self.uri_template = uri_template
+        self.reads = 0
+        self.errors = 0
+        self.rows = 0
+        parsed = urlparse(uri_template)
+        if parsed.scheme == "s3":
+            options: Dict[str, Any] = {"access_key": access_key, "secret_key": secret_key, "region": region}
+            if endpoint:
+                # MinIO and other S3-compatible stores
+                endpoint_url = urlparse(endpoint if "://" in endpoint else f"http://{endpoint}")
+                options["endpoint_override"] = endpoint_url.netloc
+                options["scheme"] = endpoint_url.scheme
+            self.filesystem = pafs.S3FileSystem(**{key: value for key, value in options.items() if value})
+            self._prefix = parsed.netloc + parsed.path
+        else:
+            self.filesystem = pafs.LocalFileSystem()
+            self._prefix = parsed.path if parsed.scheme == "file" else uri_template
+        self._local = isinstance(self.filesystem, pafs.LocalFileSystem)
+
+    def path(self, project_id: str, job_id: str) -> str:
+        return self._prefix.format(project_id=project_id, job_id=job_id)
+
+    def read(self, project_id: str, job_id: str, columns: Optional[Sequence[str]] = None) -> List[Dict]:
+        """
+        Rows of the job's result file. Only `columns` present in the file are read
+        (all columns when none match); local files are memory-mapped.
+        """
+        return self.read_table(project_id, job_id, columns).to_pylist()
+
+    def read_table(self, project_id: str, job_id: str, columns: Optional[Sequence[str]] = None) -> Any:
+        """The job's result file as an Arrow table, with the same column selection as read()."""
+        import pyarrow.parquet as pq
+
+        try:
+            path = self.path(project_id, job_id)
+            if self._local:
+                parquet_file = pq.ParquetFile(path, memory_map=True)
+            else:
+                parquet_file = pq.ParquetFile(self.filesystem.open_input_file(path))
+            available = set(parquet_file.schema_arrow.names)
+            projection = [column for column in dict.fromkeys(columns or []) if column in available] or None
+            table = parquet_file.read(columns=projection, use_threads=True)
+        except Exception:
+            self.errors += 1
+            raise
+        self.reads += 1
+        self.rows += table.num_rows
+        return table
+
+    def stats(self) -> Dict[str, Any]:
+        return {"uri_template": self.uri_template, "reads": self.reads, "rows": self.rows, "errors": self.errors}
+
+
+def projected_columns(query_spec: Dict) -> List[str]:
+    """Output column names of a QuerySpec's select list (aliases where given)."""
+    columns = []
+    for item in query_spec.get("select") or []:
+        if isinstance(item, dict):
+            name = item.get("as") or item.get("column")
+        else:
+            name = str(item)
+        if name:
+            columns.append(name)
+    return columns
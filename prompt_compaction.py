@@ -0,0 +1,105 @@
+# prompt_compaction.py
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: falls back to a character-based estimate
+    tiktoken = None
+
+from query_validation import schema_columns
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens, with tiktoken's cl100k_base when installed, else about four characters per token."""
+    global _ENCODING
+    if tiktoken is not None and _ENCODING is None:
+        try:
+            _ENCODING = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # the encoding file is downloaded on first use; offline hosts estimate instead
+            _ENCODING = False
+    if _ENCODING:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(str(text).lower().replace("_", " ")))
+
+
+def rank_columns(columns: List[Tuple[str, Optional[str]]], prompts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    """Columns ordered by how many of their name's words the prompts use; ties keep schema order."""
+    prompt_words = set()
+    for prompt in prompts:
+        prompt_words |= _words(prompt)
+
+    def score(column: Tuple[str, Optional[str]]) -> int:
+        words = _words(column[0])
+        return len(words & prompt_words) + (2 if words and words <= prompt_words else 0)
+
+    return sorted(columns, key=score, reverse=True)
+
+
+def compact_suggestions(suggestions: List[Dict]) -> List[Dict]:
+    """Suggestions reduced to the prompt and each chosen chart's id and name."""
+    compact = []
+    for suggestion in suggestions:
+        chosen = [
+            {"id": chart.get("id", chart.get("chart_id")), "name": chart.get("name")} if isinstance(chart, dict) else chart
+            for chart in suggestion.get("chosen_charts") or []
+        ]
+        compact.append({"user_prompt": suggestion.get("user_prompt"), "chosen_charts": chosen})
+    return compact
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def build_compact_content(
+    dataset_metadata: Dict,
+    suggestions: List[Dict],
+    charts_json: str,
+    budget: int,
+    fixed_tokens: int = 0,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Query-builder user message with columns as {"name", "type"} sorted by relevance
+    to the prompts, and the least relevant columns dropped until the message plus
+    `fixed_tokens` (the system prompt) fits `budget`. Returns (content, stats).
+    """
+    columns = schema_columns(dataset_metadata)
+    compact = compact_suggestions(suggestions)
+    suggestions_json = _dumps(compact)
+
+    def render(kept: List[Tuple[str, Optional[str]]]) -> str:
+        metadata = _dumps({"columns": [{"name": name, "type": data_type} for name, data_type in kept]})
+        return f"Dataset metadata: {metadata}\nRecommended charts with prompts: {suggestions_json}\nChart configurations: {charts_json}"
+
+    if not columns:
+        # Unrecognized metadata shape: send it as it is
+        content = f"Dataset metadata: {_dumps(dataset_metadata)}\nRecommended charts with prompts: {suggestions_json}\nChart configurations: {charts_json}"
+        return content, {"tokens": count_tokens(content), "columns_total": 0, "columns_sent": 0}
+
+    ranked = rank_columns(columns, [str(suggestion.get("user_prompt", "")) for suggestion in compact])
+    kept = len(ranked)
+    content = render(ranked)
+    tokens = count_tokens(content)
+    if budget > 0 and fixed_tokens + tokens > budget:
+        # Binary search for the most columns that fit, keeping at least one
+        low, high = 1, len(ranked)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fixed_tokens + count_tokens(render(ranked[:middle])) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        kept = low
+        content = render(ranked[:kept])
+        tokens = count_tokens(content)
+    return content, {"tokens": tokens, "columns_total": len(columns), "columns_sent": kept}
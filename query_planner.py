@@ -0,0 +1,213 @@
+# query_planner.py
+
+import json
+from numbers import Number
+from typing import Any, Dict, List, Optional, Tuple
+
+# Aggregations whose per-chart value can be rebuilt from a finer-grained fused result
+FUSABLE_AGGREGATIONS = ("sum", "min", "max", "count", "avg")
+_QUERY_KEYS = {"source", "select", "filters", "groupBy", "orderBy", "limit"}
+
+
+class ChartProjection:
+    """How to rebuild one chart's rows from the fused query's rows."""
+
+    def __init__(self, chart: Dict, group_keys: List[Tuple[str, str]], measures: List[Tuple[str, str, Tuple[str, ...]]]):
+        self.chart = chart
+        # (fused column, output name) per group key; (output name, aggregation, fused columns) per measure
+        self.group_keys = group_keys
+        self.measures = measures
+        self.order_by = chart["query"].get("orderBy") or []
+        if isinstance(self.order_by, dict):
+            self.order_by = [self.order_by]
+        self.limit = chart["query"].get("limit")
+
+
+class FusedQuery:
+    def __init__(self, query: Dict, projections: List[ChartProjection]):
+        self.query = query
+        self.projections = projections
+
+    @property
+    def charts(self) -> List[Dict]:
+        return [projection.chart for projection in self.projections]
+
+
+def _analyze(query: Dict) -> Optional[Tuple[List[Tuple[str, str]], List[Tuple[str, str, str]], str]]:
+    """
+    (group columns as (column, output), measures as (aggregation, column, output), filters key)
+    for an aggregate-only QuerySpec, or None when it cannot take part in fusion.
+    """
+    if not isinstance(query, dict) or set(query) - _QUERY_KEYS:
+        return None
+    select, group_by = query.get("select"), query.get("groupBy") or []
+    if not isinstance(select, list) or not select or not isinstance(group_by, list):
+        return None
+    group_columns, measures = [], []
+    for item in select:
+        if not isinstance(item, dict) or not item.get("column"):
+            return None
+        column, output = item["column"], item.get("as") or item["column"]
+        aggregation = (item.get("aggregation") or "").lower()
+        if aggregation:
+            if aggregation not in FUSABLE_AGGREGATIONS:
+                return None
+            measures.append((aggregation, column, output))
+        elif column in group_by or output in group_by:
+            group_columns.append((column, output))
+        else:
+            # Raw (non-aggregated) rows cannot be rebuilt from a coarser result
+            return None
+    if not measures or len(group_columns) != len(group_by):
+        return None
+    filters = query.get("filters") or []
+    if not isinstance(filters, list):
+        return None
+    filters_key = json.dumps(
+        sorted(json.dumps(item, sort_keys=True, default=str) for item in filters)
+    )
+    return group_columns, measures, filters_key
+
+
+def plan_fusion(charts: List[Dict], max_group_columns: int = 3) -> Tuple[List[FusedQuery], List[Dict]]:
+    """
+    Group charts whose queries share a source and filters and are pure aggregations,
+    and fuse charts whose group columns are contained in another chart's into that
+    chart's query. The fused query is grouped exactly like that widest chart, which
+    has no limit, so it never scans more groups than the widest chart would alone.
+    Returns (fused queries, charts to run on their own).
+    """
+    candidates: Dict[Tuple[str, str], List[Tuple[Dict, Any]]] = {}
+    single: List[Dict] = []
+    for chart in charts:
+        query = chart.get("query")
+        analysis = _analyze(query) if isinstance(query, dict) else None
+        if analysis is None:
+            single.append(chart)
+            continue
+        candidates.setdefault((str(query.get("source", "")), analysis[2]), []).append((chart, analysis))
+
+    fused: List[FusedQuery] = []
+    for (source, _), members in candidates.items():
+        for cluster in _nested_clusters(members):
+            columns = [column for column, _ in cluster[0][1][0]]
+            if len(cluster) < 2 or len(columns) > max_group_columns:
+                single.extend(chart for chart, _ in cluster)
+                continue
+            fused.append(_build_fused_query(source, cluster, columns))
+    return fused, single
+
+
+def _nested_clusters(members: List[Tuple[Dict, Any]]) -> List[List[Tuple[Dict, Any]]]:
+    """
+    Split charts into clusters led by a chart without a limit whose group columns
+    contain every other member's. A chart with a limit only leads a cluster of one,
+    since its fused query would have to fetch every group.
+    """
+    def group_set(member: Tuple[Dict, Any]) -> frozenset:
+        return frozenset(column for column, _ in member[1][0])
+
+    def limited(member: Tuple[Dict, Any]) -> bool:
+        return member[0]["query"].get("limit") is not None
+
+    # Widest unlimited charts first, so they become the leaders
+    ordered = sorted(members, key=lambda member: (limited(member), -len(group_set(member))))
+    clusters: List[List[Tuple[Dict, Any]]] = []
+    for member in ordered:
+        for cluster in clusters:
+            leader = cluster[0]
+            if not limited(leader) and group_set(member) <= group_set(leader):
+                cluster.append(member)
+                break
+        else:
+            clusters.append([member])
+    return clusters
+
+
+def _build_fused_query(source: str, members: List[Tuple[Dict, Any]], union: List[str]) -> FusedQuery:
+    components: Dict[Tuple[str, str], str] = {}
+
+    def component(aggregation: str, column: str) -> str:
+        key = (aggregation, column)
+        if key not in components:
+            components[key] = f"__m{len(components)}"
+        return components[key]
+
+    projections = []
+    for chart, (group_columns, measures, _) in members:
+        chart_measures = []
+        for aggregation, column, output in measures:
+            if aggregation == "avg":
+                parts = (component("sum", column), component("count", column))
+            else:
+                parts = (component(aggregation, column),)
+            chart_measures.append((output, aggregation, parts))
+        projections.append(ChartProjection(chart, group_columns, chart_measures))
+
+    first_query = members[0][0]["query"]
+    query = {
+        "source": source,
+        "select": [{"column": column} for column in union]
+        + [{"column": column, "aggregation": aggregation, "as": alias} for (aggregation, column), alias in components.items()],
+        "filters": first_query.get("filters") or [],
+        "groupBy": union,
+        "orderBy": [],
+        "limit": None,
+    }
+    return FusedQuery(query, projections)
+
+
+def _combine(aggregation: str, values: List[Any]) -> Any:
+    present = [value for value in values if value is not None]
+    if aggregation == "count":
+        return sum(present)
+    if not present:
+        return None
+    if aggregation == "min":
+        return min(present)
+    if aggregation == "max":
+        return max(present)
+    return sum(present)
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # None sorts last; mixed types fall back to their string form
+    if value is None:
+        return (2, "")
+    if isinstance(value, Number) and not isinstance(value, bool):
+        return (0, value)
+    return (1, str(value))
+
+
+def project_rows(rows: List[Dict], projection: ChartProjection) -> List[Dict]:
+    """Re-aggregate fused rows down to one chart's grouping, then apply its orderBy and limit."""
+    # Measures can share a fused column (e.g. count and avg of one column); collect each once
+    parts = list(dict.fromkeys(part for _, _, measure_parts in projection.measures for part in measure_parts))
+    groups: Dict[Tuple, Dict[str, List[Any]]] = {}
+    for row in rows:
+        key = tuple(row.get(column) for column, _ in projection.group_keys)
+        bucket = groups.setdefault(key, {})
+        for part in parts:
+            bucket.setdefault(part, []).append(row.get(part))
+
+    result = []
+    for key, bucket in groups.items():
+        out = {output: value for (_, output), value in zip(projection.group_keys, key)}
+        for output, aggregation, measure_parts in projection.measures:
+            if aggregation == "avg":
+                total, count = _combine("sum", bucket[measure_parts[0]]), _combine("count", bucket[measure_parts[1]])
+                out[output] = total / count if total is not None and count else None
+            else:
+                out[output] = _combine(aggregation, bucket[measure_parts[0]])
+        result.append(out)
+
+    outputs = {column: output for column, output in projection.group_keys}
+    for item in reversed(projection.order_by):
+        if not isinstance(item, dict):
+            continue
+        name = outputs.get(item.get("column"), item.get("column"))
+        reverse = str(item.get("direction") or "asc").lower() == "desc"
+        result.sort(key=lambda row: _sort_key(row.get(name)), reverse=reverse)
+    if isinstance(projection.limit, int) and projection.limit >= 0:
+        result = result[:projection.limit]
+    return result
@@ -0,0 +1,259 @@
+# query_validation.py
+
+import re
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+Aggregation = Literal["sum", "avg", "min", "max", "count", "count_distinct"]
+Operator = Literal["=", "!=", "<", "<=", ">", ">=", "in", "between", "contains"]
+
+AGGREGATION_SYNONYMS = {
+    "average": "avg", "mean": "avg", "total": "sum",
+    "distinct_count": "count_distinct", "count distinct": "count_distinct",
+    "countdistinct": "count_distinct", "nunique": "count_distinct",
+}
+OPERATOR_SYNONYMS = {
+    "==": "=", "eq": "=", "equals": "=", "<>": "!=", "ne": "!=", "neq": "!=",
+    "gt": ">", "lt": "<", "gte": ">=", "ge": ">=", "lte": "<=", "le": "<=",
+    "like": "contains", "ilike": "contains",
+}
+_CALL_RE = re.compile(r"^\s*(\w+)\s*\(\s*(distinct\s+)?([^)]+?)\s*\)\s*(?:as\s+(\w+))?\s*$", re.IGNORECASE)
+_ALIAS_RE = re.compile(r"^\s*(.+?)\s+as\s+(\w+)\s*$", re.IGNORECASE)
+_ORDER_RE = re.compile(r"^\s*(.+?)\s+(asc|desc)\s*$", re.IGNORECASE)
+
+
+class SelectItem(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, extra="forbid")
+    column: str
+    aggregation: Optional[Aggregation] = None
+    as_: Optional[str] = Field(None, alias="as")
+
+
+class FilterItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    column: str
+    operator: Operator
+    value: Any = None
+
+
+class OrderItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    column: str
+    direction: Literal["asc", "desc"] = "asc"
+
+
+class QuerySpec(BaseModel):
+    """The data-lakehouse query format produced by ChartValidatorAndQueryBuilder."""
+    model_config = ConfigDict(extra="forbid")
+    source: str = "uploaded_file"
+    select: List[SelectItem] = Field(min_length=1)
+    filters: List[FilterItem] = []
+    groupBy: List[str] = []
+    orderBy: List[OrderItem] = []
+    limit: Optional[int] = Field(None, ge=1)
+
+    def to_query(self) -> Dict[str, Any]:
+        query = self.model_dump(by_alias=True)
+        query["select"] = [{key: value for key, value in item.items() if value is not None} for item in query["select"]]
+        return query
+
+
+class QueryValidationError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def schema_columns(schema: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+    """(name, data_type) pairs from a {"columns": [...]} schema as returned by fetch_table_columns."""
+    columns = []
+    for column in schema.get("columns", []) if isinstance(schema, dict) else []:
+        if isinstance(column, dict):
+            name = column.get("name") or column.get("col_name") or column.get("column_name")
+            data_type = column.get("data_type") or column.get("type")
+        else:
+            name, data_type = column, None
+        # Spark DESCRIBE output adds "# Partition Information"-style marker rows
+        if name and not str(name).startswith("#"):
+            columns.append((str(name), str(data_type) if data_type else None))
+    return columns
+
+
+def schema_column_names(schema: Dict[str, Any]) -> List[str]:
+    """Column names from a {"columns": [...]} schema as returned by fetch_table_columns."""
+    return [name for name, _ in schema_columns(schema)]
+
+
+def _as_list(value: Any, name: str, repairs: List[str]) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    repairs.append(f"{name}: wrapped single value in a list")
+    return [value]
+
+
+def _repair_select_item(item: Any, repairs: List[str]) -> Any:
+    if isinstance(item, str):
+        match = _CALL_RE.match(item)
+        if match:
+            aggregation = match.group(1).lower()
+            if match.group(2):
+                aggregation = "count_distinct"
+            repaired = {"column": match.group(3).strip(), "aggregation": aggregation}
+            if match.group(4):
+                repaired["as"] = match.group(4)
+        else:
+            alias = _ALIAS_RE.match(item)
+            repaired = {"column": alias.group(1).strip(), "as": alias.group(2)} if alias else {"column": item.strip()}
+        repairs.append(f"select: converted string {item!r} to an object")
+        item = repaired
+    if isinstance(item, dict):
+        item = dict(item)
+        for key in ("alias", "name"):
+            if key in item and "as" not in item and "column" in item:
+                item["as"] = item.pop(key)
+                repairs.append(f"select: renamed '{key}' to 'as'")
+        aggregation = item.get("aggregation")
+        if isinstance(aggregation, str):
+            normalized = aggregation.strip().lower()
+            normalized = AGGREGATION_SYNONYMS.get(normalized, normalized)
+            if normalized in ("", "none", "null"):
+                item.pop("aggregation")
+            elif normalized != aggregation:
+                item["aggregation"] = normalized
+                repairs.append(f"select: aggregation {aggregation!r} -> {normalized!r}")
+        if item.get("as") in ("", None):
+            item.pop("as", None)
+    return item
+
+
+def _repair_filter_item(item: Any, repairs: List[str]) -> Any:
+    if not isinstance(item, dict):
+        return item
+    item = dict(item)
+    operator = item.get("operator", "=")
+    if isinstance(operator, str):
+        normalized = operator.strip().lower()
+        normalized = OPERATOR_SYNONYMS.get(normalized, normalized)
+        if normalized != operator:
+            item["operator"] = normalized
+            repairs.append(f"filters: operator {operator!r} -> {normalized!r}")
+    if item.get("operator") == "in" and not isinstance(item.get("value"), list):
+        item["value"] = [item.get("value")]
+        repairs.append("filters: wrapped 'in' value in a list")
+    return item
+
+
+def _repair_order_item(item: Any, repairs: List[str]) -> Any:
+    if isinstance(item, str):
+        match = _ORDER_RE.match(item)
+        item_repaired = {"column": match.group(1), "direction": match.group(2).lower()} if match else {"column": item.strip()}
+        repairs.append(f"orderBy: converted string {item!r} to an object")
+        return item_repaired
+    if isinstance(item, dict):
+        item = dict(item)
+        direction = item.get("direction")
+        if direction is None or direction == "":
+            item.pop("direction", None)
+        elif isinstance(direction, str) and direction.strip().lower() != direction:
+            item["direction"] = direction.strip().lower()
+            repairs.append(f"orderBy: direction {direction!r} -> {item['direction']!r}")
+    return item
+
+
+def validate_query(query: Any, columns: Optional[List[str]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Repair common shape errors in an LLM-generated QuerySpec, validate it, and check
+    its columns against `columns` (skipped when the schema is unknown).
+    Returns (query, repairs); raises QueryValidationError when it cannot be fixed.
+    """
+    if not isinstance(query, dict):
+        raise QueryValidationError([f"query must be an object, got {type(query).__name__}"])
+    repairs: List[str] = []
+    raw = dict(query)
+    raw["select"] = [_repair_select_item(item, repairs) for item in _as_list(raw.get("select"), "select", repairs)]
+    raw["filters"] = [_repair_filter_item(item, repairs) for item in _as_list(raw.get("filters"), "filters", repairs)]
+    raw["groupBy"] = [str(item) for item in _as_list(raw.get("groupBy"), "groupBy", repairs)]
+    raw["orderBy"] = [_repair_order_item(item, repairs) for item in _as_list(raw.get("orderBy"), "orderBy", repairs)]
+    limit = raw.get("limit")
+    if isinstance(limit, str) and limit.strip().isdigit():
+        raw["limit"] = int(limit)
+        repairs.append("limit: parsed string as an integer")
+    elif isinstance(limit, (int, float)) and not isinstance(limit, bool) and limit <= 0:
+        raw["limit"] = None
+        repairs.append(f"limit: dropped non-positive limit {limit}")
+
+    try:
+        spec = QuerySpec.model_validate(raw)
+    except ValidationError as e:
+        raise QueryValidationError([
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ])
+
+    errors: List[str] = []
+    if columns:
+        by_lower = {column.lower(): column for column in columns}
+
+        def resolve(column: str, where: str) -> str:
+            if column in columns or column == "*":
+                return column
+            match = by_lower.get(column.lower())
+            if match is not None:
+                repairs.append(f"{where}: column {column!r} -> {match!r}")
+                return match
+            errors.append(f"{where}: unknown column {column!r}")
+            return column
+
+        for item in spec.select:
+            item.column = resolve(item.column, "select")
+        for item in spec.filters:
+            item.column = resolve(item.column, "filters")
+
+    for item in spec.filters:
+        if item.operator == "between" and not (isinstance(item.value, list) and len(item.value) == 2):
+            errors.append(f"filters: 'between' on {item.column!r} needs a [low, high] value")
+    if errors:
+        raise QueryValidationError(errors)
+
+    # groupBy/orderBy may name a table column or a select alias
+    known = {item.as_ or item.column for item in spec.select} | {item.column for item in spec.select} | set(columns or [])
+    known_lower = {name.lower(): name for name in known}
+
+    def reference(name: str, where: str) -> Optional[str]:
+        # Without a schema only aliases are checked; other names are kept as they are
+        if name in known or not columns:
+            return name
+        match = known_lower.get(name.lower())
+        if match is not None:
+            repairs.append(f"{where}: column {name!r} -> {match!r}")
+        return match
+
+    group_by = []
+    for name in spec.groupBy:
+        resolved = reference(name, "groupBy")
+        if resolved is None:
+            # Dropping a grouping column changes what the chart means
+            errors.append(f"groupBy: unknown column {name!r}")
+        elif resolved not in group_by:
+            group_by.append(resolved)
+    if errors:
+        raise QueryValidationError(errors)
+    if any(item.aggregation for item in spec.select):
+        for item in spec.select:
+            if not item.aggregation and item.column not in group_by and (item.as_ or item.column) not in group_by:
+                group_by.append(item.column)
+                repairs.append(f"groupBy: added non-aggregated column {item.column!r}")
+    spec.groupBy = group_by
+    order_by = []
+    for item in spec.orderBy:
+        resolved = reference(item.column, "orderBy")
+        if resolved is None:
+            # Only the row order is lost
+            repairs.append(f"orderBy: dropped unknown column {item.column!r}")
+            continue
+        item.column = resolved
+        order_by.append(item)
+    spec.orderBy = order_by
+    return spec.to_query(), repairs
@@ -0,0 +1,173 @@
+# response_encoding.py
+
+import base64
+import gzip
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+from chart_data import result_rows
+
+FORMATS = ("rows", "columnar", "arrow")
+# Accept media types that select a chart data format
+COLUMNAR_MEDIA_TYPE = "application/vnd.chart-api.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+class UnsupportedFormat(Exception):
+    """Raised when a requested format needs an optional package that is not installed."""
+
+
+class ArrowConversionError(ValueError):
+    """Raised when rows cannot form an Arrow table, e.g. a column mixing numbers and strings."""
+
+
+def negotiate_format(format_param: Optional[str], accept: str) -> str:
+    """Chart data format from the `format` query param, else the Accept header; defaults to rows."""
+    if format_param:
+        format_param = format_param.lower()
+        if format_param not in FORMATS:
+            raise ValueError(f"Unknown format '{format_param}', expected one of {', '.join(FORMATS)}")
+        return format_param
+    accept = (accept or "").lower()
+    if ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return "rows"
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported Content-Encoding from Accept-Encoding: br (if brotli is installed), gzip, or None."""
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            offered[name] = quality
+    if offered.get("br", 0) > 0 and _brotli() is not None:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return _brotli().compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def to_columnar(rows: List[Dict]) -> Dict[str, Any]:
+    """Rows as {"columns": [...], "values": [[column values], ...]}; missing cells become None."""
+    columns: Dict[str, None] = {}
+    for row in rows:
+        for column in row:
+            columns.setdefault(column, None)
+    names = list(columns)
+    return {"columns": names, "values": [[row.get(name) for row in rows] for name in names]}
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_arrow_ipc(rows: List[Dict]) -> bytes:
+    """Rows as an Arrow IPC stream (requires pyarrow)."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedFormat("Arrow output requires 'pyarrow' (pip install pyarrow)")
+    try:
+        table = pa.Table.from_pylist(rows)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        raise ArrowConversionError(str(e))
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def encode_chart_data(result: Dict, data_format: str) -> Dict:
+    """
+    Copy of an /execute-prompt or /build-queries result with each chart's rows in
+    `data_format`. Arrow data is a base64 IPC stream, since one response holds
+    charts with different schemas. A chart whose rows do not fit an Arrow schema
+    keeps its rows, marked "format": "rows".
+    """
+    if data_format == "rows":
+        return result
+    charts = []
+    for chart in result.get("charts", []):
+        data = chart.get("data")
+        key, rows = result_rows(data) if isinstance(data, dict) else (None, [])
+        if key is None:
+            charts.append(chart)
+            continue
+        if data_format == "columnar":
+            encoded = to_columnar(rows)
+        else:
+            try:
+                encoded = base64.b64encode(to_arrow_ipc(rows)).decode("ascii")
+            except ArrowConversionError as e:
+                print(f"Arrow encoding failed for chart {chart.get('chart_id')} ({e}); sending rows")
+                charts.append({**chart, "data": {**data, "format": "rows"}})
+                continue
+        charts.append({**chart, "data": {**data, key: encoded, "format": data_format}})
+    return {**result, "charts": charts}
+
+
+def _json_default(value: Any) -> Any:
+    """Encode NumPy values, Decimals, dates and anything else (UUID, ...) the encoder does not know."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, Decimal):
+        # As FastAPI's jsonable_encoder: an int without a fractional exponent, else a float
+        exponent = value.as_tuple().exponent
+        return int(value) if isinstance(exponent, int) and exponent >= 0 else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def serialize(payload: Any) -> bytes:
+    """Compact UTF-8 JSON, with orjson (native NumPy/datetime support) when installed."""
+    if orjson is not None:
+        return orjson.dumps(
+            payload,
+            default=_json_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(payload, default=_json_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode_body(payload: Any, content_encoding: Optional[str], min_size: int = 1024) -> Tuple[bytes, Optional[str]]:
+    """Serialized JSON body, compressed when an encoding was negotiated and the body is at least `min_size` bytes."""
+    body = serialize(payload)
+    if content_encoding is None or len(body) < min_size:
+        return body, None
+    return compress(body, content_encoding), content_encoding
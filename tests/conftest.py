@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# main.py refuses to import without an API key; tests never call the LLM
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
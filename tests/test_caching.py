@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+
+from caching import SingleFlight
+
+
+def test_work_continues_while_one_caller_still_waits():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "rows"
+
+        first = asyncio.ensure_future(flights.do("k", work))
+        second = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == "rows"
+        assert first.cancelled()
+        assert flights.stats()["cancelled"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_last_caller_leaving_cancels_the_work():
+    async def scenario():
+        flights = SingleFlight()
+        stopped = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(60)
+            finally:
+                stopped.set()
+
+        callers = [asyncio.ensure_future(flights.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(stopped.wait(), timeout=1)
+        assert flights.stats() == {"in_flight": 0, "started": 1, "shared": 1, "cancelled": 1}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_chart_query_stops_polling(monkeypatch):
+    import main
+
+    polls = []
+
+    def handler(request):
+        if request.method == "POST":
+            return httpx.Response(200, json={"jobId": "j1"})
+        polls.append(request.url.path)
+        return httpx.Response(200, json={"status": "running"})
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(main, "get_datalake_client", lambda: client)
+        query = {"source": "p.t", "select": [{"column": "region"}], "filters": [], "groupBy": [], "orderBy": [], "limit": None}
+        caller = asyncio.ensure_future(main.execute_query_on_datalake(query, use_cache=False))
+        while not polls:
+            await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        count = len(polls)
+        await asyncio.sleep(0.5)
+        assert len(polls) == count
+        assert main.QUERY_FLIGHTS.stats()["in_flight"] == 0
+        # The cancelled job gave back its scheduler slots
+        assert not main._DATALAKE_SEMAPHORE.locked()
+        assert main._project_semaphore("p")._value == max(1, main.DATALAKE_PROJECT_MAX_CONCURRENCY)
+        await client.aclose()
+
+    asyncio.run(scenario())
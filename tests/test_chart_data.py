@@ -0,0 +1,30 @@
+from decimal import Decimal
+
+from chart_data import OTHER_LABEL, histogram_bins, lttb, reduce_rows, top_n_with_other
+
+
+def test_decimal_values_are_numbers():
+    rows = [{"region": f"r{index}", "total": Decimal(index)} for index in range(10)]
+    top = top_n_with_other(rows, "region", "total", 4)
+    assert [row["region"] for row in top] == ["r7", "r8", "r9", OTHER_LABEL]
+    assert top[-1]["total"] == float(sum(range(7)))
+
+    bins = histogram_bins([{"price": Decimal("1.50")}, {"price": Decimal("3.50")}], "price", 2)
+    assert [row["count"] for row in bins] == [1, 1]
+
+    line = [{"x": index, "y": Decimal(100 if index == 5 else 0)} for index in range(10)]
+    assert line[5] in lttb(line, "x", "y", 3)
+
+
+def test_histogram_without_numeric_values_keeps_rows():
+    rows = [{"segment": f"s{index}"} for index in range(5)]
+    encoding = {"x": "segment"}
+    assert reduce_rows(rows, "histogram", encoding, 10) == (rows, None)
+    assert reduce_rows(rows, "histogram", encoding, 3) == (rows[:3], "truncate")
+
+
+def test_raw_histogram_is_binned():
+    rows = [{"price": float(index)} for index in range(10)]
+    binned, strategy = reduce_rows(rows, "histogram", {"x": "price"}, 5)
+    assert strategy == "bins"
+    assert sum(row["count"] for row in binned) == 10
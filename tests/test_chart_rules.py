@@ -0,0 +1,107 @@
+import pytest
+
+from chart_rules import (
+    CATEGORICAL_DIMENSION, DATETIME, NUMERIC_MEASURE, RuleQueryBuilder, column_kind, derive_role_requirements,
+)
+from chart_catalog import ChartCatalog
+from charts_config import charts_config
+
+COLUMNS = [
+    ("region", column_kind("varchar")),
+    ("order_date", column_kind("date")),
+    ("revenue", column_kind("decimal(12,2)")),
+]
+
+
+@pytest.fixture
+def rules():
+    return RuleQueryBuilder(ChartCatalog(charts_config))
+
+
+@pytest.mark.parametrize(
+    "data_type, kind",
+    [("bigint", NUMERIC_MEASURE), ("DECIMAL(10,2)", NUMERIC_MEASURE), ("timestamp_ntz", DATETIME),
+     ("string", CATEGORICAL_DIMENSION), ("array<int>", None), (None, None)],
+)
+def test_column_kind(data_type, kind):
+    assert column_kind(data_type) == kind
+
+
+def test_derives_typed_roles_from_data_requirements():
+    pie = next(chart for chart in charts_config if chart["name"] == "pie_chart")
+    roles = derive_role_requirements(pie)
+    assert roles["categories"] == CATEGORICAL_DIMENSION
+    assert roles["values"] == NUMERIC_MEASURE
+
+
+def test_builds_bar_chart_sum_by_dimension(rules):
+    outcome, chart = rules.build("Revenue by region", "bar_chart", COLUMNS)
+    assert outcome == "built"
+    assert chart["query"]["select"] == [
+        {"column": "region"}, {"column": "revenue", "aggregation": "sum", "as": "sum_revenue"},
+    ]
+    assert chart["query"]["groupBy"] == ["region"]
+    assert chart["query"]["orderBy"] == [{"column": "sum_revenue", "direction": "desc"}]
+    assert chart["encoding"] == {"x": "region", "y": "sum_revenue", "color": ""}
+
+
+def test_line_chart_orders_by_date(rules):
+    outcome, chart = rules.build("Revenue over order date", "line_chart", COLUMNS)
+    assert outcome == "built"
+    assert chart["query"]["groupBy"] == ["order_date"]
+    assert chart["query"]["orderBy"] == [{"column": "order_date", "direction": "asc"}]
+
+
+@pytest.mark.parametrize("prompt, aggregation", [
+    ("Average revenue by region", "avg"),
+    ("Maximum revenue by region", "max"),
+    ("Min revenue by region", "min"),
+])
+def test_explicit_aggregation_words(rules, prompt, aggregation):
+    outcome, chart = rules.build(prompt, "bar_chart", COLUMNS)
+    assert outcome == "built"
+    assert chart["query"]["select"][1]["aggregation"] == aggregation
+
+
+@pytest.mark.parametrize("prompt", [
+    "Highest revenue region",
+    "Largest revenue by region",
+    "Peak revenue by region",
+    "Top 10 regions by revenue",
+    "Revenue by region where revenue is positive",
+])
+def test_rankings_and_filters_go_to_the_llm(rules, prompt):
+    assert rules.build(prompt, "bar_chart", COLUMNS) == ("ambiguous", None)
+
+
+@pytest.mark.parametrize("prompt, chart_name", [
+    ("Show total revenue as a big number", "big_number"),
+    ("Revenue big number", "big_number"),
+    ("Total revenue by region as a big number", "bar_chart"),
+])
+def test_big_number_is_not_a_count(rules, prompt, chart_name):
+    outcome, chart = rules.build(prompt, chart_name, COLUMNS)
+    assert outcome == "built"
+    assert {"column": "revenue", "aggregation": "sum", "as": "sum_revenue"} in chart["query"]["select"]
+
+
+def test_counts_rows_per_group_without_a_measure(rules):
+    columns = [("region", CATEGORICAL_DIMENSION), ("price", NUMERIC_MEASURE), ("qty", NUMERIC_MEASURE)]
+    outcome, chart = rules.build("Number of orders per region", "bar_chart", columns)
+    assert outcome == "built"
+    assert chart["query"]["select"][1] == {"column": "region", "aggregation": "count", "as": "count_region"}
+
+
+def test_several_candidate_columns_are_ambiguous(rules):
+    columns = COLUMNS + [("cost", NUMERIC_MEASURE)]
+    assert rules.build("Show by region", "bar_chart", columns) == ("ambiguous", None)
+
+
+def test_skips_charts_the_table_cannot_fill(rules):
+    columns = [("region", CATEGORICAL_DIMENSION), ("segment", CATEGORICAL_DIMENSION)]
+    assert rules.build("Distribution", "histogram", columns) == ("skip", None)
+
+
+def test_unsupported_chart_is_ambiguous(rules):
+    assert rules.build("Revenue by region", "sunburst_chart", COLUMNS) == ("ambiguous", None)
+    assert rules.stats()["ambiguous"] == 1
@@ -0,0 +1,61 @@
+import json
+
+from json_stream import ArrayItemParser
+
+CHARTS = [
+    {"user_prompt": "Show {revenue} by \"region\"", "chart_id": 1, "query": {"select": [{"column": "region"}], "groupBy": ["region"]}},
+    {"user_prompt": "Trend over time", "chart_id": 2, "encoding": {"x": "month", "y": "total"}},
+]
+
+
+def feed_all(parser, text, size):
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return items
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    text = json.dumps({"intent": "visualization", "charts": CHARTS})
+    parser = ArrayItemParser("charts")
+    first_end = text.index("}}, {") + 2
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [CHARTS[0]]
+    assert parser.feed(text[first_end:]) == [CHARTS[1]]
+    assert parser.items_found == 2
+    assert parser.text == text
+
+
+def test_chunk_boundaries_do_not_matter():
+    text = json.dumps({"charts": CHARTS}, indent=2)
+    for size in (1, 2, 3, 7, len(text)):
+        assert feed_all(ArrayItemParser("charts"), text, size) == CHARTS
+
+
+def test_skips_code_fence_and_other_keys():
+    text = "```json\n" + json.dumps({"notes": [{"chart_id": 9}], "intent": "charts", "charts": CHARTS[:1]}) + "\n```"
+    assert feed_all(ArrayItemParser("charts"), text, 5) == CHARTS[:1]
+
+
+def test_nested_array_with_the_same_key_is_ignored():
+    text = json.dumps({"meta": {"charts": [{"chart_id": 9}]}, "charts": CHARTS[1:]})
+    assert feed_all(ArrayItemParser("charts"), text, 4) == CHARTS[1:]
+
+
+def test_escaped_quotes_and_braces_in_strings():
+    text = json.dumps({"charts": [{"user_prompt": 'a \\"}] {[ b', "chart_id": 3}]})
+    assert feed_all(ArrayItemParser("charts"), text, 1) == [{"user_prompt": 'a \\"}] {[ b', "chart_id": 3}]
+
+
+def test_malformed_item_is_skipped_and_not_counted():
+    text = '{"charts": [{"chart_id": 1, "x": tru}, {"chart_id": 2}, 3, "s"]}'
+    parser = ArrayItemParser("charts")
+    assert feed_all(parser, text, 6) == [{"chart_id": 2}]
+    assert parser.items_found == 1
+
+
+def test_truncated_output_keeps_complete_items():
+    text = json.dumps({"charts": CHARTS})
+    parser = ArrayItemParser("charts")
+    assert feed_all(parser, text[:-20], 8) == CHARTS[:1]
+    assert parser.items_found == 1
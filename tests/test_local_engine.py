@@ -0,0 +1,77 @@
+import pytest
+
+from local_engine import LocalQueryEngine, UnsupportedQuery, compile_query_spec
+
+
+def test_compiles_aggregation_filters_order_and_limit():
+    sql, params = compile_query_spec(
+        {
+            "select": [{"column": "region"}, {"column": "amount", "aggregation": "SUM", "as": "total"}],
+            "filters": [
+                {"column": "year", "operator": ">=", "value": 2020},
+                {"column": "channel", "operator": "in", "value": ["web", "shop"]},
+                {"column": "amount", "operator": "between", "value": [1, 9]},
+                {"column": "name", "operator": "contains", "value": "ab"},
+            ],
+            "groupBy": ["region"],
+            "orderBy": [{"column": "total", "direction": "desc"}],
+            "limit": 10,
+        },
+        "t",
+    )
+    assert sql == (
+        'SELECT "region", SUM("amount") AS "total" FROM t'
+        ' WHERE "year" >= ? AND "channel" IN (?, ?) AND "amount" BETWEEN ? AND ? AND CAST("name" AS VARCHAR) ILIKE ?'
+        ' GROUP BY "region" ORDER BY "total" DESC LIMIT ?'
+    )
+    assert params == [2020, "web", "shop", 1, 9, "%ab%", 10]
+
+
+def test_quotes_identifiers_and_binds_values():
+    sql, params = compile_query_spec(
+        {"select": [{"column": 'we"ird'}], "filters": [{"column": "c", "operator": "=", "value": "x' OR 1=1"}]},
+        "t",
+    )
+    assert sql == 'SELECT "we""ird" FROM t WHERE "c" = ?'
+    assert params == ["x' OR 1=1"]
+
+
+def test_count_star_and_empty_in():
+    sql, params = compile_query_spec(
+        {"select": [{"column": "*", "aggregation": "count", "as": "n"}], "filters": [{"column": "c", "operator": "in", "value": []}]},
+        "t",
+    )
+    assert sql == 'SELECT COUNT(*) AS "n" FROM t WHERE FALSE'
+    assert params == []
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"select": [{"column": "a", "aggregation": "median"}]},
+        {"select": [{"column": "a"}], "filters": [{"column": "a", "operator": "like", "value": "x"}]},
+        {"select": [{"column": "a"}], "filters": [{"column": "a", "operator": "between", "value": 3}]},
+        {"select": [{"column": "a"}], "orderBy": [{"column": "a", "direction": "sideways"}]},
+        {"select": [{"aggregation": "sum"}]},
+    ],
+)
+def test_rejects_untranslatable_specs(query):
+    with pytest.raises(UnsupportedQuery):
+        compile_query_spec(query, "t")
+
+
+@pytest.mark.parametrize("project_id, table_name, ok", [("p1", "sales_2024", True), ("p", "a-b", True), ("p", "t t", False), ("..", "t", False), ("p", "a/b", False)])
+def test_supports_table(project_id, table_name, ok):
+    assert LocalQueryEngine.supports_table(project_id, table_name) is ok
+
+
+def test_failed_pull_backs_off_until_max_age(tmp_path, monkeypatch):
+    pytest.importorskip("duckdb")
+    engine = LocalQueryEngine(str(tmp_path), max_age=60)
+    assert engine.needs_refresh("p", "t")
+    engine.record_failure("p", "t", "timed out")
+    assert not engine.needs_refresh("p", "t")
+    assert not engine.can_serve("p", "t")
+    failed_at = engine.extract_info("p", "t")["failed_at"]
+    monkeypatch.setattr("local_engine.time.time", lambda: failed_at + 61)
+    assert engine.needs_refresh("p", "t")
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import main  # noqa: E402
+from parquet_results import ParquetResultReader, projected_columns  # noqa: E402
+
+TEMPLATE = "{root}/wh/{{project_id}}/queries/{{job_id}}/data.parquet"
+QUERY = {
+    "source": "proj.sales",
+    "select": [{"column": "region"}, {"column": "amount", "aggregation": "sum", "as": "total"}],
+    "groupBy": ["region"],
+}
+
+
+def write_result(root, project_id, job_id, rows):
+    path = root / "wh" / project_id / "queries" / job_id
+    path.mkdir(parents=True)
+    pq.write_table(pa.Table.from_pylist(rows), str(path / "data.parquet"))
+
+
+@pytest.fixture
+def reader(tmp_path, monkeypatch):
+    reader = ParquetResultReader(TEMPLATE.format(root=tmp_path))
+    monkeypatch.setattr(main, "PARQUET_READER", reader)
+    return reader
+
+
+def test_projected_columns_uses_aliases():
+    assert projected_columns(QUERY) == ["region", "total"]
+
+
+def test_reads_only_selected_columns(tmp_path, reader):
+    write_result(tmp_path, "proj", "job1", [{"region": "EU", "total": 3.5, "extra": 1}])
+    assert reader.read("proj", "job1", ["region", "total", "missing"]) == [{"region": "EU", "total": 3.5}]
+    assert reader.stats()["reads"] == 1
+
+
+def test_attach_fills_rows_omitted_from_status(tmp_path, reader):
+    write_result(tmp_path, "proj", "job2", [{"region": "EU", "total": 3.5}, {"region": "US", "total": 1.0}])
+    status = {"status": "completed", "jobId": "job2"}
+    result = asyncio.run(main.attach_parquet_rows(status, QUERY, "job2"))
+    assert result["resultData"] == [{"region": "EU", "total": 3.5}, {"region": "US", "total": 1.0}]
+    assert result["rowCount"] == 2
+    assert result["resultSource"] == "parquet"
+
+
+def test_attach_keeps_rows_already_in_status(reader):
+    status = {"status": "completed", "resultData": [{"region": "EU", "total": 3.5}]}
+    assert asyncio.run(main.attach_parquet_rows(status, QUERY, "not-written")) is status
+    assert reader.stats()["reads"] == 0
+
+
+def test_attach_fails_when_rows_omitted_and_file_missing(reader):
+    with pytest.raises(main.HTTPException) as error:
+        asyncio.run(main.attach_parquet_rows({"status": "completed"}, QUERY, "missing"))
+    assert error.value.status_code == 502
+    assert reader.stats()["errors"] == 1
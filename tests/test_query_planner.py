@@ -0,0 +1,138 @@
+import math
+
+import pytest
+
+from query_planner import plan_fusion, project_rows
+
+
+def chart(chart_id, select, group_by=(), filters=(), order_by=(), limit=None):
+    return {
+        "chart_id": chart_id,
+        "query": {
+            "source": "proj.sales",
+            "select": list(select),
+            "filters": list(filters),
+            "groupBy": list(group_by),
+            "orderBy": list(order_by),
+            "limit": limit,
+        },
+    }
+
+
+BY_REGION = chart(1, [{"column": "region"}, {"column": "amount", "aggregation": "sum", "as": "total"}], ["region"])
+BY_REGION_PRODUCT = chart(
+    2,
+    [{"column": "region"}, {"column": "product"}, {"column": "amount", "aggregation": "avg", "as": "mean"}],
+    ["region", "product"],
+)
+BY_PRODUCT = chart(3, [{"column": "product"}, {"column": "amount", "aggregation": "max", "as": "peak"}], ["product"])
+TOTAL = chart(4, [{"column": "amount", "aggregation": "count", "as": "n"}])
+BY_CHANNEL = chart(5, [{"column": "channel"}, {"column": "amount", "aggregation": "sum", "as": "total"}], ["channel"])
+
+
+def chart_ids(charts):
+    return sorted(chart["chart_id"] for chart in charts)
+
+
+def test_fuses_charts_nested_in_the_widest_grouping():
+    fused, single = plan_fusion([BY_REGION, BY_REGION_PRODUCT, BY_PRODUCT, TOTAL])
+    assert len(fused) == 1 and single == []
+    assert chart_ids(fused[0].charts) == [1, 2, 3, 4]
+    assert fused[0].query["groupBy"] == ["region", "product"]
+
+
+def test_does_not_fuse_unrelated_groupings():
+    fused, single = plan_fusion([BY_REGION, BY_CHANNEL])
+    assert fused == []
+    assert chart_ids(single) == [1, 5]
+
+
+def test_limited_chart_never_leads_a_fused_query():
+    top_pairs = chart(6, BY_REGION_PRODUCT["query"]["select"], ["region", "product"], limit=10)
+    fused, single = plan_fusion([top_pairs, BY_REGION])
+    assert fused == []
+    assert chart_ids(single) == [1, 6]
+
+
+def test_different_filters_are_not_fused():
+    filtered = chart(7, BY_REGION["query"]["select"], ["region"], filters=[{"column": "year", "operator": "=", "value": 2024}])
+    fused, single = plan_fusion([BY_REGION_PRODUCT, filtered])
+    assert fused == []
+    assert chart_ids(single) == [2, 7]
+
+
+def test_raw_rows_are_not_fused():
+    raw = chart(8, [{"column": "region"}, {"column": "amount"}])
+    fused, single = plan_fusion([BY_REGION_PRODUCT, raw, BY_REGION])
+    assert chart_ids(single) == [8]
+    assert chart_ids(fused[0].charts) == [1, 2]
+
+
+def test_project_rows_applies_order_and_limit():
+    top = chart(
+        9,
+        BY_REGION["query"]["select"],
+        ["region"],
+        order_by=[{"column": "total", "direction": "desc"}],
+        limit=1,
+    )
+    fused, _ = plan_fusion([BY_REGION_PRODUCT, top])
+    projection = next(p for p in fused[0].projections if p.chart is top)
+    sum_column = next(item["as"] for item in fused[0].query["select"] if item.get("aggregation") == "sum")
+    rows = [
+        {"region": "EU", "product": "a", sum_column: 5},
+        {"region": "EU", "product": "b", sum_column: 1},
+        {"region": "US", "product": "a", sum_column: 4},
+    ]
+    assert project_rows(rows, projection) == [{"region": "EU", "total": 6}]
+
+
+def _normalized(rows):
+    def value(v):
+        return round(v, 9) if isinstance(v, float) and not math.isnan(v) else v
+
+    return sorted((tuple(sorted((k, value(v)) for k, v in row.items())) for row in rows), key=repr)
+
+
+def test_fused_results_match_per_chart_duckdb_execution():
+    duckdb = pytest.importorskip("duckdb")
+    from local_engine import compile_query_spec
+
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE sales (region VARCHAR, product VARCHAR, channel VARCHAR, amount DOUBLE)")
+    conn.executemany(
+        "INSERT INTO sales VALUES (?, ?, ?, ?)",
+        [
+            ("EU", "a", "web", 10.0), ("EU", "a", "shop", 2.5), ("EU", "b", "web", 7.0),
+            ("US", "a", "web", 1.0), ("US", "c", "shop", None), ("US", "c", "web", 4.0),
+            ("APAC", "b", "shop", 3.0),
+        ],
+    )
+
+    def run(query):
+        sql, params = compile_query_spec(query, "sales")
+        cursor = conn.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    charts = [BY_REGION, BY_REGION_PRODUCT, BY_PRODUCT, TOTAL]
+    fused, single = plan_fusion(charts)
+    assert single == [] and len(fused) == 1
+    fused_rows = run(fused[0].query)
+    for projection in fused[0].projections:
+        assert _normalized(project_rows(fused_rows, projection)) == _normalized(run(projection.chart["query"]))
+
+
+def test_row_capped_chart_does_not_lead_a_fused_query(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "QUERY_FUSION", True)
+    total = {"column": "amount", "aggregation": "sum", "as": "total"}
+    heatmap = {**chart(10, [{"column": "region"}, {"column": "order_date"}, total], ["region", "order_date"]), "chart_type": "heatmap"}
+    bar = {**chart(11, [{"column": "region"}, total], ["region"]), "chart_type": "bar_chart"}
+    pie = {**chart(12, [{"column": "region"}, total], ["region"]), "chart_type": "pie_chart"}
+    fused, single, rejected = main.plan_chart_queries([heatmap, bar, pie], "p.t")
+    assert heatmap["query"]["limit"] == main.chart_max_rows(heatmap) + 1
+    assert chart_ids(single) == [10] and rejected == []
+    assert len(fused) == 1 and chart_ids(fused[0].charts) == [11, 12]
+    assert fused[0].query["groupBy"] == ["region"]
@@ -0,0 +1,101 @@
+import pytest
+
+from query_validation import QueryValidationError, schema_column_names, schema_columns, validate_query
+
+COLUMNS = ["Region", "product", "amount", "order_date"]
+
+
+def test_valid_query_passes_unchanged():
+    query = {
+        "source": "uploaded_file",
+        "select": [{"column": "Region"}, {"column": "amount", "aggregation": "sum", "as": "total"}],
+        "filters": [{"column": "product", "operator": "=", "value": "NY "}],
+        "groupBy": ["Region"],
+        "orderBy": [{"column": "total", "direction": "desc"}],
+        "limit": 10,
+    }
+    repaired, repairs = validate_query(query, COLUMNS)
+    assert repairs == []
+    assert repaired == query
+
+
+def test_repairs_common_shape_errors():
+    repaired, repairs = validate_query(
+        {
+            "select": ["region", "SUM(amount) AS total", {"column": "amount", "aggregation": "average", "alias": "mean"}],
+            "filters": {"column": "product", "operator": "==", "value": "a"},
+            "groupBy": "region",
+            "orderBy": ["total DESC"],
+            "limit": "5",
+        },
+        COLUMNS,
+    )
+    assert repaired["select"] == [
+        {"column": "Region"},
+        {"column": "amount", "aggregation": "sum", "as": "total"},
+        {"column": "amount", "aggregation": "avg", "as": "mean"},
+    ]
+    assert repaired["filters"] == [{"column": "product", "operator": "=", "value": "a"}]
+    assert repaired["groupBy"] == ["Region"]
+    assert repaired["orderBy"] == [{"column": "total", "direction": "desc"}]
+    assert repaired["limit"] == 5
+    assert repairs
+
+
+def test_adds_missing_group_by_for_aggregations():
+    repaired, repairs = validate_query(
+        {"select": [{"column": "product"}, {"column": "amount", "aggregation": "sum"}]}, COLUMNS
+    )
+    assert repaired["groupBy"] == ["product"]
+    assert "groupBy: added non-aggregated column 'product'" in repairs
+
+
+def test_unknown_select_column_is_an_error():
+    with pytest.raises(QueryValidationError) as error:
+        validate_query({"select": [{"column": "revenue", "aggregation": "sum"}]}, COLUMNS)
+    assert error.value.errors == ["select: unknown column 'revenue'"]
+
+
+def test_unknown_group_by_column_is_an_error():
+    with pytest.raises(QueryValidationError) as error:
+        validate_query(
+            {"select": [{"column": "amount", "aggregation": "sum"}], "groupBy": ["country"]}, COLUMNS
+        )
+    assert error.value.errors == ["groupBy: unknown column 'country'"]
+
+
+def test_unknown_order_by_column_is_dropped():
+    repaired, repairs = validate_query(
+        {"select": [{"column": "product"}], "orderBy": [{"column": "revenue"}, {"column": "PRODUCT"}]}, COLUMNS
+    )
+    assert repaired["orderBy"] == [{"column": "product", "direction": "asc"}]
+    assert "orderBy: dropped unknown column 'revenue'" in repairs
+
+
+def test_without_schema_names_are_not_checked():
+    repaired, _ = validate_query(
+        {"select": [{"column": "x", "aggregation": "sum"}], "groupBy": ["y"], "orderBy": [{"column": "y"}]}
+    )
+    assert repaired["groupBy"] == ["y"]
+    assert repaired["orderBy"] == [{"column": "y", "direction": "asc"}]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT * FROM t",
+        {"select": []},
+        {"select": [{"column": "amount", "aggregation": "median"}]},
+        {"select": [{"column": "amount"}], "filters": [{"column": "amount", "operator": "between", "value": 3}]},
+        {"select": [{"column": "amount"}], "unexpected": True},
+    ],
+)
+def test_rejects_unfixable_queries(query):
+    with pytest.raises(QueryValidationError):
+        validate_query(query, COLUMNS)
+
+
+def test_schema_columns_skips_marker_rows():
+    schema = {"columns": [{"col_name": "a", "data_type": "int"}, {"col_name": "# Partition Information"}, "b"]}
+    assert schema_columns(schema) == [("a", "int"), ("b", None)]
+    assert schema_column_names(schema) == ["a", "b"]
@@ -0,0 +1,34 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+import response_encoding
+from response_encoding import serialize
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(response_encoding, "orjson", None)
+    return request.param
+
+
+def test_serialize_matches_jsonable_encoder(encoder):
+    payload = {
+        "charts": [{
+            "chart_id": 1,
+            "data": {"resultData": [
+                {"v": Decimal("0.00"), "n": Decimal("12"), "big": Decimal("1E+3"), "d": date(2024, 1, 2)},
+                {"v": Decimal("-3.25"), "n": 7, "big": 1.5, "d": datetime(2024, 1, 2, 3, 4, 5)},
+            ]},
+        }],
+    }
+    assert json.loads(serialize(payload)) == json.loads(json.dumps(jsonable_encoder(payload)))
+    row = json.loads(serialize(payload))["charts"][0]["data"]["resultData"][0]
+    assert row["v"] == 0.0 and isinstance(row["v"], float)
+    assert row["n"] == 12 and isinstance(row["n"], int)